@@ -1,11 +1,17 @@
 # clickup_client.py
 import os
 import logging
-from typing import Any, Dict, List, Optional
-import re # <-- Добавлен import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
+from email_index import EmailIndex
+from ratelimit import RateGovernor
+from utils import _extract_email, _norm_name, _task_description
+
 log = logging.getLogger("clickup")
 
 CLICKUP_BASE = "https://api.clickup.com/api/v2"
@@ -15,6 +21,23 @@ CLICKUP_SPACE_ID = os.getenv("CLICKUP_SPACE_ID", "")
 CLICKUP_TEAM_ID = os.getenv("CLICKUP_TEAM_ID", "")
 # он у нас есть в env, но мы его БОЛЬШЕ НЕ ИСПОЛЬЗУЕМ специально
 CLICKUP_TEMPLATE_LIST_ID = os.getenv("CLICKUP_TEMPLATE_LIST_ID", "")
+# сколько секунд доверяем кэшу листов спейса
+CLICKUP_LISTS_CACHE_TTL = int(os.getenv("CLICKUP_LISTS_CACHE_TTL", "300"))
+# через сколько секунд перепроверяем поля, которые не удалось найти/создать
+CLICKUP_FIELDS_NEGATIVE_TTL = int(os.getenv("CLICKUP_FIELDS_NEGATIVE_TTL", "3600"))
+# не чаще чем раз в N секунд досинхронизируем email-индекс при промахе
+EMAIL_INDEX_SYNC_INTERVAL = int(os.getenv("EMAIL_INDEX_SYNC_INTERVAL", "60"))
+# губернатор запросов: повторы на 429/5xx, бэкофф, сколько запросов окна держим про запас
+CLICKUP_MAX_RETRIES = int(os.getenv("CLICKUP_MAX_RETRIES", "5"))
+CLICKUP_BACKOFF_BASE = float(os.getenv("CLICKUP_BACKOFF_BASE", "1.0"))
+CLICKUP_BACKOFF_MAX = float(os.getenv("CLICKUP_BACKOFF_MAX", "30"))
+CLICKUP_RATE_RESERVE = int(os.getenv("CLICKUP_RATE_RESERVE", "2"))
+# пока в окне остаётся больше стольких запросов, губернатор не притормаживает
+CLICKUP_RATE_LOW_WATER = int(os.getenv("CLICKUP_RATE_LOW_WATER", "10"))
+# сколько задач создаём параллельно в bulk_create_tasks (темп всё равно держит губернатор)
+CLICKUP_BULK_WORKERS = int(os.getenv("CLICKUP_BULK_WORKERS", "8"))
+# сколько секунд не пытаемся ставить статус на листе после "Status not found"
+CLICKUP_STATUS_FALLBACK_TTL = int(os.getenv("CLICKUP_STATUS_FALLBACK_TTL", "600"))
 
 # ===== наши статусы =====
 NEW_STATUS = "NEW"
@@ -37,35 +60,193 @@ class ClickUpError(Exception):
     pass
 
 
+# наш набор статусов для листа (PUT /list/{id})
+PIPELINE_STATUSES = [
+    {"status": NEW_STATUS,     "type": "open",   "orderindex": 0, "color": "#4b7bec"},
+    {"status": READY_STATUS,   "type": "open",   "orderindex": 1, "color": "#8854d0"},
+    {"status": SENT_STATUS,    "type": "open",   "orderindex": 2, "color": "#20bf6b"},
+    {"status": REPLIED_STATUS, "type": "closed", "orderindex": 3, "color": "#0fb9b1"},
+    {"status": INVALID_STATUS, "type": "closed", "orderindex": 4, "color": "#eb3b5a"},
+]
+
+# почему не создалась задача и как повторить
+FALLBACK_STATUS = "status"   # "Status not found" / CRTSK_001 — статус ещё не применился на листе
+FALLBACK_FIELDS = "fields"   # FIELD_033 — лимит кастомных полей на плане
+
+
+def _create_fallback(err_text: str) -> Optional[str]:
+    if "Status not found" in err_text or "CRTSK_001" in err_text:
+        return FALLBACK_STATUS
+    if "FIELD_033" in err_text:
+        return FALLBACK_FIELDS
+    return None
+
+
+def _task_payload(
+    name: str,
+    description: str = "",
+    status: Optional[str] = None,
+    custom_fields: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Тело POST /list/{id}/task; без status/custom_fields — "базовое" (для повторов).
+    """
+    p: Dict[str, Any] = {"name": name}
+    if description:
+        p["description"] = description
+    if status:
+        p["status"] = status
+    if custom_fields:
+        cf_list = [{"id": fid, "value": val} for fid, val in custom_fields.items() if fid]
+        if cf_list:
+            p["custom_fields"] = cf_list
+    return p
+
+
+def _lead_custom_values(field_ids: Dict[str, Optional[str]], lead: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Значения кастомных полей лида по id полей листа (None — полей нет вовсе).
+    """
+    if not any(field_ids.values()):
+        return None
+    return {
+        field_ids.get("Email"): lead.get("email") or "",
+        field_ids.get("Website"): lead.get("website") or "",
+        field_ids.get("Facebook"): lead.get("facebook") or "",
+        field_ids.get("Instagram"): lead.get("instagram") or "",
+        field_ids.get("LinkedIn"): lead.get("linkedin") or "",
+    }
+
+
+def _retryable(method: str, status_code: Optional[int]) -> bool:
+    """
+    Можно ли повторить запрос. 429 — всегда (ClickUp его не выполнял).
+    5xx и обрывы связи — только GET/PUT: POST мог успеть создать задачу, повтор дал бы дубль.
+    """
+    if status_code == 429:
+        return True
+    if status_code is None or status_code >= 500:
+        return method in ("GET", "PUT")
+    return False
+
+
+def _task_list_params(
+    page: int,
+    statuses: Optional[List[str]] = None,
+    include_description: bool = False,
+    include_closed: bool = False,
+    updated_after: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Параметры GET /list/{id}/task для одной страницы (см. ClickUpClient.iter_leads).
+    """
+    params: Dict[str, Any] = {
+        "subtasks": "true",
+        "page": page
+    }
+    if statuses:
+        params["statuses[]"] = list(statuses)
+    if include_description:
+        params["include_markdown_description"] = "true"
+    if include_closed:
+        params["include_closed"] = "true"
+    if updated_after:
+        params["date_updated_gt"] = int(updated_after)
+    return params
+
+
 class ClickUpClient:
     def __init__(self) -> None:
         if not CLICKUP_API_TOKEN:
             raise RuntimeError("CLICKUP_API_TOKEN is not set")
         self.session = requests.Session()
         self.session.headers.update({"Authorization": CLICKUP_API_TOKEN})
+        # общий на токен темп запросов (все потоки клиента идут через него)
+        self.governor = RateGovernor(
+            CLICKUP_RATE_RESERVE, CLICKUP_BACKOFF_BASE, CLICKUP_BACKOFF_MAX, CLICKUP_RATE_LOW_WATER
+        )
+        # индекс лидов по листам: list_id -> {нормализованное имя -> task_id}
+        self._lead_index: Dict[str, Dict[str, str]] = {}
+        self._lead_index_lock = threading.Lock()
+        # реестр листов спейса (кэш с TTL) + счётчики попаданий
+        self._lists_cache: Optional[List[Dict[str, Any]]] = None
+        self._lists_cache_ts = 0.0
+        self._lists_cache_lock = threading.Lock()
+        self._cache_stats: Dict[str, int] = {
+            "lists_hits": 0,
+            "lists_misses": 0,
+            "fields_hits": 0,
+            "fields_misses": 0,
+        }
+        # id кастомных полей по листам: list_id -> (время, {имя поля -> id | None})
+        # None = поле не нашли и создать не смогли (негативная запись)
+        self._field_cache: Dict[str, Any] = {}
+        self._field_cache_lock = threading.Lock()
+        self._field_resolve_locks: Dict[str, threading.Lock] = {}
+        # план не даёт создавать поля (FIELD_033) — больше не пробуем ни на одном листе
+        self._fields_plan_blocked = False
+        # найденный обход create_task по листам: list_id -> (время, FALLBACK_*)
+        self._create_fallbacks: Dict[str, Any] = {}
+        self._create_fallbacks_lock = threading.Lock()
+        # постоянный индекс email -> задача (для разбора ответов)
+        self.email_index = EmailIndex()
+        self._email_sync_lock = threading.Lock()
+        self._email_synced_at = 0.0
 
     # ---------------- low level ----------------
 
+    def _request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Запрос через губернатор: темп по X-RateLimit-*, повторы на 429 и 5xx.
+        """
+        for attempt in range(CLICKUP_MAX_RETRIES + 1):
+            wait = self.governor.delay()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                r = self.session.request(method, url, params=params, json=json, timeout=25)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt < CLICKUP_MAX_RETRIES and _retryable(method, None):
+                    time.sleep(self.governor.backoff(attempt))
+                    continue
+                raise ClickUpError(f"{method} {url} -> {e}")
+            self.governor.update(r.headers)
+
+            if attempt < CLICKUP_MAX_RETRIES and _retryable(method, r.status_code):
+                if r.status_code == 429:
+                    pause = self.governor.throttled(r.headers, attempt)
+                else:
+                    pause = self.governor.backoff(attempt)
+                    time.sleep(pause)
+                log.warning("ClickUp %s %s -> %s, retry in %.1fs", method, url, r.status_code, pause)
+                continue
+
+            if r.status_code >= 300:
+                log.warning("ClickUp %s %s -> %s %s", method, url, r.status_code, r.text[:200])
+                raise ClickUpError(f"{method} {url} -> {r.status_code} {r.text}")
+            return r.json()
+        raise ClickUpError(f"{method} {url} -> retries exhausted")
+
     def _get(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        r = self.session.get(url, params=params, timeout=25)
-        if r.status_code >= 300:
-            log.warning("ClickUp GET %s -> %s %s", url, r.status_code, r.text[:200])
-            raise ClickUpError(f"GET {url} -> {r.status_code} {r.text}")
-        return r.json()
+        return self._request("GET", url, params=params)
 
     def _post(self, url: str, json: Dict[str, Any]) -> Dict[str, Any]:
-        r = self.session.post(url, json=json, timeout=25)
-        if r.status_code >= 300:
-            log.warning("ClickUp POST %s -> %s %s", url, r.status_code, r.text[:200])
-            raise ClickUpError(f"POST {url} -> {r.status_code} {r.text}")
-        return r.json()
+        return self._request("POST", url, json=json)
 
     def _put(self, url: str, json: Dict[str, Any]) -> Dict[str, Any]:
-        r = self.session.put(url, json=json, timeout=25)
-        if r.status_code >= 300:
-            log.warning("ClickUp PUT %s -> %s %s", url, r.status_code, r.text[:200])
-            raise ClickUpError(f"PUT {url} -> {r.status_code} {r.text}")
-        return r.json()
+        return self._request("PUT", url, json=json)
+
+    def rate_budget(self) -> Dict[str, Any]:
+        """
+        Бюджет запросов токена по последним заголовкам ClickUp (см. RateGovernor.budget).
+        """
+        return self.governor.budget()
 
     # ---------------- lists ----------------
 
@@ -74,20 +255,41 @@ class ClickUpClient:
         data = self._get(url)
         return data.get("lists", [])
 
+    def _space_lists(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Листы спейса из кэша; в ClickUp идём, только если кэш пуст или протух.
+        """
+        with self._lists_cache_lock:
+            fresh = (
+                self._lists_cache is not None
+                and time.monotonic() - self._lists_cache_ts < CLICKUP_LISTS_CACHE_TTL
+            )
+            if fresh and not refresh:
+                self._cache_stats["lists_hits"] += 1
+                return self._lists_cache
+            self._cache_stats["lists_misses"] += 1
+
+        lists = self._list_lists_in_space()
+        with self._lists_cache_lock:
+            self._lists_cache = lists
+            self._lists_cache_ts = time.monotonic()
+        return lists
+
+    def invalidate_lists_cache(self) -> None:
+        with self._lists_cache_lock:
+            self._lists_cache = None
+            self._lists_cache_ts = 0.0
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self._lists_cache_lock, self._field_cache_lock:
+            return dict(self._cache_stats)
+
     def _set_pipeline(self, list_id: str) -> None:
         """
         Ставим наш набор статусов через корректный эндпоинт.
         """
         url = f"{CLICKUP_BASE}/list/{list_id}"
-        payload = {
-            "statuses": [
-                {"status": NEW_STATUS,     "type": "open",   "orderindex": 0, "color": "#4b7bec"},
-                {"status": READY_STATUS,   "type": "open",   "orderindex": 1, "color": "#8854d0"},
-                {"status": SENT_STATUS,    "type": "open",   "orderindex": 2, "color": "#20bf6b"},
-                {"status": REPLIED_STATUS, "type": "closed", "orderindex": 3, "color": "#0fb9b1"},
-                {"status": INVALID_STATUS, "type": "closed", "orderindex": 4, "color": "#eb3b5a"},
-            ]
-        }
+        payload = {"statuses": PIPELINE_STATUSES}
         try:
             self._put(url, payload)
             log.info("clickup:set pipeline for list %s", list_id)
@@ -112,11 +314,15 @@ class ClickUpClient:
         """
         url = f"{CLICKUP_BASE}/list/{list_id}/field"
         payload = {"type": ftype, "name": name, "required": False}
+        if self._fields_plan_blocked:
+            return None
         try:
             resp = self._post(url, payload)
         except ClickUpError as e:
             # это как раз твой случай: FIELD_033 → план не даёт
             log.warning("clickup:cannot create field %s on list %s (%s)", name, list_id, e)
+            if "FIELD_033" in str(e):
+                self._fields_plan_blocked = True
             return None
 
         fid = resp.get("id")
@@ -132,7 +338,46 @@ class ClickUpClient:
     def _ensure_required_fields(self, list_id: str) -> Dict[str, Optional[str]]:
         """
         Создаём нужные поля, НО если план не даёт — вернём словарь с None.
+        Результат кэшируется на лист: найденные id — навсегда,
+        None ("не смогли") — на CLICKUP_FIELDS_NEGATIVE_TTL секунд.
         """
+        cached = self._cached_fields(list_id)
+        if cached is not None:
+            return cached
+
+        # один поток на лист ищет/создаёт поля, остальные ждут и берут его результат
+        # (иначе параллельные воркеры создадут дубли полей)
+        with self._field_resolve_lock(list_id):
+            cached = self._cached_fields(list_id, count=False)
+            if cached is not None:
+                return cached
+            result = self._resolve_required_fields(list_id)
+            with self._field_cache_lock:
+                self._field_cache[list_id] = (time.monotonic(), result)
+            return dict(result)
+
+    def _cached_fields(self, list_id: str, count: bool = True) -> Optional[Dict[str, Optional[str]]]:
+        with self._field_cache_lock:
+            cached = self._field_cache.get(list_id)
+            if cached is not None:
+                ts, fields = cached
+                has_negative = not all(fields.values())
+                if not has_negative or time.monotonic() - ts < CLICKUP_FIELDS_NEGATIVE_TTL:
+                    if count:
+                        self._cache_stats["fields_hits"] += 1
+                    return dict(fields)
+            if count:
+                self._cache_stats["fields_misses"] += 1
+            return None
+
+    def _field_resolve_lock(self, list_id: str) -> threading.Lock:
+        with self._field_cache_lock:
+            lock = self._field_resolve_locks.get(list_id)
+            if lock is None:
+                lock = self._field_resolve_locks[list_id] = threading.Lock()
+            return lock
+
+    def _resolve_required_fields(self, list_id: str) -> Dict[str, Optional[str]]:
         try:
             existing = self._list_custom_fields(list_id)
         except ClickUpError as e:
@@ -149,6 +394,13 @@ class ClickUpClient:
                 result[fname] = fid
         return result
 
+    def drop_field_cache(self, list_id: Optional[str] = None) -> None:
+        with self._field_cache_lock:
+            if list_id is None:
+                self._field_cache.clear()
+            else:
+                self._field_cache.pop(list_id, None)
+
     def get_or_create_list_for_state(self, state: str) -> str:
         """
         ВАЖНО: больше НЕ создаём из шаблона.
@@ -157,10 +409,11 @@ class ClickUpClient:
         state = state.upper()
         target_name = f"LEADS-{state}"
 
-        # 1. ищем уже существующий
-        for lst in self._list_lists_in_space():
-            if lst.get("name") == target_name:
-                return lst["id"]
+        # 1. ищем уже существующий (сначала в кэше, при промахе — перечитываем спейс)
+        for refresh in (False, True):
+            for lst in self._space_lists(refresh=refresh):
+                if lst.get("name") == target_name:
+                    return lst["id"]
 
         # 2. создаём пустой лист в спейсе
         url = f"{CLICKUP_BASE}/space/{CLICKUP_SPACE_ID}/list"
@@ -168,6 +421,7 @@ class ClickUpClient:
         resp = self._post(url, payload)
         new_id = resp["id"]
         log.info("clickup:created list %s (%s)", new_id, target_name)
+        self.invalidate_lists_cache()
 
         # 3. ставим наш pipeline
         self._set_pipeline(new_id)
@@ -179,32 +433,138 @@ class ClickUpClient:
 
     # ---------------- tasks ----------------
 
-    def get_leads_from_list(self, list_id: str) -> List[Dict[str, Any]]:
-        # Это наша функция с пагинацией из прошлого шага
+    def iter_leads(
+        self,
+        list_id: str,
+        statuses: Optional[List[str]] = None,
+        include_description: bool = False,
+        include_closed: bool = False,
+        updated_after: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+        prefetch: bool = False,
+        raise_errors: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Задачи листа по мере загрузки страниц (генератор).
+        statuses — фильтр по статусам на стороне ClickUp (statuses[]).
+        include_description — сразу тянуть markdown-описание (без GET /task на каждую).
+        updated_after — только задачи, изменённые после этого момента (unix ms).
+        fields — оставить в задачах только эти ключи (ClickUp сам так не умеет,
+        режем на нашей стороне, чтобы большие листы не держать целиком в памяти).
+        prefetch — пока вызывающий разбирает страницу, следующая грузится в фоне.
+        raise_errors — ошибку страницы отдать наружу (ClickUpError), а не считать концом листа.
+        """
         url = f"{CLICKUP_BASE}/list/{list_id}/task"
-        all_tasks: List[Dict[str, Any]] = []
-        page = 0
-
-        while True:
-            params = {
-                "subtasks": "true",
-                "page": page
-            }
+
+        def _fetch(page: int) -> Optional[Dict[str, Any]]:
+            params = _task_list_params(page, statuses, include_description, include_closed, updated_after)
             try:
-                data = self._get(url, params=params)
+                return self._get(url, params=params)
             except ClickUpError:
-                break # Ошибка (напр. 404)
-                
-            tasks = data.get("tasks", [])
-            
-            if not tasks:
-                # Если ClickUp вернул пустой список 'tasks', значит, страницы закончились
-                break
-                
-            all_tasks.extend(tasks)
-            page += 1
-            
-        return all_tasks
+                if raise_errors:
+                    raise
+                return None # Ошибка (напр. 404)
+
+        pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = 0
+            pending = pool.submit(_fetch, page) if pool else None
+            while True:
+                data = pending.result() if pending else _fetch(page)
+                tasks = (data or {}).get("tasks", [])
+                if not tasks:
+                    # Если ClickUp вернул пустой список 'tasks', значит, страницы закончились
+                    break
+
+                last_page = bool(data.get("last_page"))
+                page += 1
+                if pool:
+                    pending = None if last_page else pool.submit(_fetch, page)
+
+                for t in tasks:
+                    yield {k: t[k] for k in fields if k in t} if fields else t
+                if last_page:
+                    break
+        finally:
+            if pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_leads_from_list(
+        self,
+        list_id: str,
+        statuses: Optional[List[str]] = None,
+        include_description: bool = False,
+        include_closed: bool = False,
+        updated_after: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Все задачи листа одним списком (см. iter_leads).
+        """
+        return list(
+            self.iter_leads(
+                list_id,
+                statuses=statuses,
+                include_description=include_description,
+                include_closed=include_closed,
+                updated_after=updated_after,
+                fields=fields,
+            )
+        )
+
+    # ---------------- lead index ----------------
+
+    def load_lead_index(self, list_id: str, refresh: bool = False) -> Dict[str, str]:
+        """
+        Загружает индекс "имя -> task_id" для листа (один проход по всем страницам).
+        Повторные вызовы берут индекс из памяти, пока не попросят refresh.
+        """
+        with self._lead_index_lock:
+            index = self._lead_index.get(list_id)
+            if index is not None and not refresh:
+                return index
+
+        index = {}
+        for t in self.get_leads_from_list(list_id, fields=("id", "name")):
+            key = _norm_name(t.get("name") or "")
+            if key and t.get("id"):
+                index.setdefault(key, t["id"])
+
+        with self._lead_index_lock:
+            self._lead_index[list_id] = index
+        log.info("clickup:lead index for list %s -> %d names", list_id, len(index))
+        return index
+
+    def _remember_lead(
+        self, list_id: str, name: str, task_id: str, description: str = ""
+    ) -> None:
+        found_email = _extract_email(description)
+        if found_email and task_id:
+            self.email_index.put(
+                found_email, task_id, list_id, self._list_name(list_id), name
+            )
+
+        key = _norm_name(name)
+        if not key or not task_id:
+            return
+        with self._lead_index_lock:
+            index = self._lead_index.get(list_id)
+            if index is not None:
+                index.setdefault(key, task_id)
+
+    def lookup_lead(self, list_id: str, name: str) -> Optional[str]:
+        """
+        task_id лида с таким названием из индекса листа (без запросов в ClickUp).
+        """
+        with self._lead_index_lock:
+            return (self._lead_index.get(list_id) or {}).get(_norm_name(name))
+
+    def drop_lead_index(self, list_id: Optional[str] = None) -> None:
+        with self._lead_index_lock:
+            if list_id is None:
+                self._lead_index.clear()
+            else:
+                self._lead_index.pop(list_id, None)
 
     def get_task_details(self, task_id: str) -> Dict[str, Any]:
         """
@@ -248,56 +608,117 @@ class ClickUpClient:
         """
         url = f"{CLICKUP_BASE}/list/{list_id}/task"
 
-        def _base_payload() -> Dict[str, Any]:
-            p: Dict[str, Any] = {"name": name}
-            if description:
-                p["description"] = description
-            return p
+        # обход для листа уже известен — сразу базовое тело, без лишней ошибки на каждую задачу
+        if self._create_fallback_for(list_id):
+            return self._post_task(url, list_id, name, description, _task_payload(name, description))
 
         # --- 1. первая попытка: как хотим ---
-        payload = _base_payload()
-        payload["status"] = status
-        if custom_fields:
-            cf_list: List[Dict[str, Any]] = []
-            for fid, val in custom_fields.items():
-                if fid:
-                    cf_list.append({"id": fid, "value": val})
-            if cf_list:
-                payload["custom_fields"] = cf_list
+        payload = _task_payload(name, description, status, custom_fields)
 
         try:
-            resp = self._post(url, payload)
-            task_id = resp.get("id")
-            if task_id:
-                log.info("clickup:created lead task %s on list %s (%s)", task_id, list_id, name)
-            return task_id
+            return self._post_task(url, list_id, name, description, payload)
         except ClickUpError as e:
-            txt = str(e)
+            fallback = _create_fallback(str(e))
 
-            # --- 2. статус ещё не применился на листе ---
-            if "Status not found" in txt or "CRTSK_001" in txt:
+            if fallback == FALLBACK_STATUS:
+                # --- 2. статус ещё не применился на листе ---
                 log.warning(
                     "clickup:create task on list %s failed (status not found) -> retrying without status & fields",
                     list_id,
                 )
-                payload2 = _base_payload()
-                # без статуса и БЕЗ кастомных полей
-                resp = self._post(url, payload2)
-                return resp.get("id")
-
-            # --- 3. лимит по кастомным полям ---
-            if "FIELD_033" in txt:
+            elif fallback == FALLBACK_FIELDS:
+                # --- 3. лимит по кастомным полям ---
                 log.warning(
                     "clickup:custom field limit on list %s -> creating task without custom fields",
                     list_id,
                 )
-                payload3 = _base_payload()
-                # и без статуса — чтобы не словить ту же гонку
-                resp = self._post(url, payload3)
-                return resp.get("id")
+            else:
+                # другое — пусть валится
+                raise
+
+            self._remember_create_fallback(list_id, fallback)
+            # без статуса и БЕЗ кастомных полей (и без статуса — чтобы не словить ту же гонку)
+            return self._post_task(url, list_id, name, description, _task_payload(name, description))
 
-            # другое — пусть валится
-            raise
+    def _post_task(
+        self, url: str, list_id: str, name: str, description: str, payload: Dict[str, Any]
+    ) -> Optional[str]:
+        resp = self._post(url, payload)
+        task_id = resp.get("id")
+        if task_id:
+            log.info("clickup:created lead task %s on list %s (%s)", task_id, list_id, name)
+            self._remember_lead(list_id, name, task_id, description)
+        return task_id
+
+    def _create_fallback_for(self, list_id: str) -> Optional[str]:
+        """
+        Какой обход create_task уже нашли на листе (None — ещё не нашли / не нужен).
+        "Status not found" — гонка после создания листа, поэтому его помним
+        только CLICKUP_STATUS_FALLBACK_TTL секунд; FIELD_033 (план) — насовсем.
+        """
+        with self._create_fallbacks_lock:
+            known = self._create_fallbacks.get(list_id)
+            if not known:
+                return None
+            ts, fallback = known
+            if fallback == FALLBACK_STATUS and time.monotonic() - ts >= CLICKUP_STATUS_FALLBACK_TTL:
+                del self._create_fallbacks[list_id]
+                return None
+            return fallback
+
+    def _remember_create_fallback(self, list_id: str, fallback: str) -> None:
+        with self._create_fallbacks_lock:
+            self._create_fallbacks[list_id] = (time.monotonic(), fallback)
+
+    def bulk_create_tasks(
+        self,
+        list_id: str,
+        leads: Sequence[Dict[str, Any]],
+        workers: Optional[int] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Создаёт задачи по лидам параллельно (темп держит губернатор запросов).
+        Первая задача идёт одна: если листу нужен обход (статус / FIELD_033),
+        он запоминается, и остальные создаются сразу без ошибки.
+        Возвращает по лиду (в том же порядке) {"name", "task_id", "status", "error"?},
+        status: created | failed | cancelled.
+        """
+        leads = list(leads)
+        if not leads:
+            return []
+        field_ids = self._ensure_required_fields(list_id)
+
+        def _one(lead: Dict[str, Any]) -> Dict[str, Any]:
+            name = (lead.get("name") or "").strip()
+            if cancelled and cancelled():
+                return {"name": name, "task_id": None, "status": "cancelled"}
+            try:
+                task_id = self.create_task(
+                    list_id=list_id,
+                    name=name,
+                    description=lead.get("address") or "",
+                    status=NEW_STATUS,
+                    custom_fields=_lead_custom_values(field_ids, lead),
+                )
+            except Exception as e:
+                log.warning("clickup:bulk create %s on list %s failed: %s", name, list_id, e)
+                return {"name": name, "task_id": None, "status": "failed", "error": str(e)}
+            return {"name": name, "task_id": task_id, "status": "created" if task_id else "failed"}
+
+        results = [_one(leads[0])]
+        rest = leads[1:]
+        if rest:
+            n = max(1, min(len(rest), workers or CLICKUP_BULK_WORKERS))
+            with ThreadPoolExecutor(max_workers=n, thread_name_prefix="clickup-bulk") as pool:
+                results.extend(pool.map(_one, rest))
+        log.info(
+            "clickup:bulk create on list %s -> %d/%d created",
+            list_id,
+            sum(1 for r in results if r["status"] == "created"),
+            len(results),
+        )
+        return results
 
     def update_task_status(self, task_id: str, status: str) -> bool:
         """
@@ -320,11 +741,10 @@ class ClickUpClient:
         if not clinic_name:
             return False
 
-        # дедуп по названию
-        tasks = self.get_leads_from_list(list_id)
-        for t in tasks:
-            if (t.get("name") or "").strip().lower() == clinic_name.lower():
-                return False
+        # дедуп по названию — через индекс листа, без лишних запросов
+        index = self.load_lead_index(list_id)
+        if _norm_name(clinic_name) in index:
+            return False
 
         # пробуем получить id полей, но если ничего не вышло — просто не будем их слать
         field_ids = self._ensure_required_fields(list_id)
@@ -332,80 +752,131 @@ class ClickUpClient:
         # Мы больше не используем кастомные поля для Email/Website,
         # но мы все еще можем использовать их для Facebook/Inst/LinkedIn, если парсер их найдет.
         # Поэтому эту логику можно оставить.
-
-        if not any(field_ids.values()):
-            # вообще нет полей → создаём без них
-            self.create_task(
-                list_id=list_id,
-                name=clinic_name,
-                description=lead.get("address") or "",
-                status=NEW_STATUS,
-                custom_fields=None,
-            )
-            return True
-
-        custom_values = {
-            field_ids.get("Email"): lead.get("email") or "",
-            field_ids.get("Website"): lead.get("website") or "",
-            field_ids.get("Facebook"): lead.get("facebook") or "",
-            field_ids.get("Instagram"): lead.get("instagram") or "",
-            field_ids.get("LinkedIn"): lead.get("linkedin") or "",
-        }
-
+        # (вообще нет полей → создаём без них)
         self.create_task(
             list_id=list_id,
             name=clinic_name,
             description=lead.get("address") or "",
             status=NEW_STATUS,
-            custom_fields=custom_values,
+            custom_fields=_lead_custom_values(field_ids, lead),
         )
         return True
 
+    def bulk_upsert_leads(
+        self,
+        list_id: str,
+        leads: Sequence[Dict[str, Any]],
+        workers: Optional[int] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        upsert_lead для пачки: дубли по названию (с листом и внутри пачки) отсеиваем
+        по индексу, остальное — через bulk_create_tasks. Результат по каждому лиду
+        в том же порядке; status: created | duplicate | failed | cancelled | skipped (нет имени).
+        Для дублей task_id — существующей задачи.
+        """
+        index = self.load_lead_index(list_id)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(leads)
+        todo: List[int] = []
+        batch_keys = set()
+        for i, lead in enumerate(leads):
+            name = (lead.get("name") or "").strip()
+            key = _norm_name(name)
+            if not name:
+                results[i] = {"name": name, "task_id": None, "status": "skipped"}
+            elif key in index or key in batch_keys:
+                results[i] = {"name": name, "task_id": index.get(key), "status": "duplicate"}
+            else:
+                batch_keys.add(key)
+                todo.append(i)
+
+        created = self.bulk_create_tasks(list_id, [leads[i] for i in todo], workers, cancelled)
+        for i, res in zip(todo, created):
+            results[i] = res
+        # дубли внутри пачки: их задача появилась в индексе только что
+        for res in results:
+            if res["status"] == "duplicate" and not res["task_id"]:
+                res["task_id"] = self.lookup_lead(list_id, res["name"])
+        return results
+
     def move_lead_to_status(self, task_id: str, status: str) -> bool:
         # Это алиас для update_task_status
         return self.update_task_status(task_id, status)
 
-    def find_task_by_email(self, email_addr: str) -> Optional[Dict[str, Any]]:
+    def _list_name(self, list_id: str) -> str:
+        try:
+            lists = self._space_lists()
+        except ClickUpError as e:
+            log.warning("clickup:cannot resolve name of list %s: %s", list_id, e)
+            return ""
+        for lst in lists:
+            if lst.get("id") == list_id:
+                return lst.get("name", "")
+        return ""
+
+    def index_task(self, task: Dict[str, Any], list_id: str, list_name: str = "") -> None:
         """
-        Ищет задачу, парся 'description', т.к. кастомных полей больше нет.
+        Обновляет email-индекс по задаче (нужен description — markdown или обычный).
         """
-        lists = self._list_lists_in_space()
-        for lst in lists: # 'lst' - это сам объект списка
-            lid = lst.get("id")
-            list_name = lst.get("name", "") # <-- 🟢 ИЗМЕНЕНИЕ: Получаем имя списка
-            if not lid:
-                continue
-            
-            # 1. Получаем легкие задачи
-            tasks = self.get_leads_from_list(lid)
-            if not tasks:
-                continue
+        task_id = task.get("id")
+        if not task_id:
+            return
+        self.email_index.put(
+            _extract_email(_task_description(task)),
+            task_id,
+            list_id,
+            list_name or self._list_name(list_id),
+            task.get("name") or "",
+        )
 
-            # 2. Перебираем их
-            for task_stub in tasks:
-                task_id = task_stub.get("id")
-                if not task_id:
+    def sync_email_index(self, force: bool = False) -> int:
+        """
+        Досинхронизирует email-индекс: по каждому листу тянем только задачи,
+        изменённые после прошлой синхронизации (первый раз — все, но пачкой,
+        с описаниями в том же запросе). Возвращает число просмотренных задач.
+        """
+        with self._email_sync_lock:
+            if not force and time.monotonic() - self._email_synced_at < EMAIL_INDEX_SYNC_INTERVAL:
+                return 0
+
+            seen = 0
+            for lst in self._space_lists():
+                lid = lst.get("id")
+                if not lid:
                     continue
-                
-                # 3. Получаем детали (с 'description')
-                task_full = self.get_task_details(task_id)
-                desc = task_full.get("description", "")
-                
-                # 4. Ищем email в description
-                if email_addr.lower() in desc.lower():
-                    # Простая проверка. Можно улучшить regex-ом
-                    
-                    # Ищем email с помощью regex
-                    match = re.search(r"Email:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})", desc, re.IGNORECASE)
-                    if match:
-                        found_email = match.group(1)
-                        if found_email.lower() == email_addr.lower():
-                            return {
-                                "task_id": task_id,
-                                "clinic_name": task_full.get("name") or "",
-                                "list_id": lid,
-                                "list_name": list_name # <-- 🟢 ИЗМЕНЕНИЕ: Возвращаем имя списка
-                            }
+                # запас в минуту на расхождение часов с ClickUp
+                started_ms = int(time.time() * 1000) - 60_000
+                since = self.email_index.last_sync_ms(lid)
+                try:
+                    for t in self.iter_leads(
+                        lid,
+                        include_description=True,
+                        include_closed=True,
+                        updated_after=since or None,
+                        raise_errors=True,
+                    ):
+                        self.index_task(t, lid, lst.get("name", ""))
+                        seen += 1
+                except ClickUpError as e:
+                    # отметку не двигаем: в следующий раз лист досканируется с прежнего момента
+                    log.warning("clickup:email index sync of list %s interrupted: %s", lid, e)
+                    continue
+                self.email_index.set_last_sync_ms(lid, started_ms)
+
+            self._email_synced_at = time.monotonic()
+            log.info("clickup:email index synced (%d tasks seen, %d emails)", seen, self.email_index.size())
+            return seen
+
+    def find_task_by_email(self, email_addr: str) -> Optional[Dict[str, Any]]:
+        """
+        Ищет задачу по email через постоянный индекс.
+        При промахе — инкрементальная досинхронизация индекса и повторный поиск.
+        """
+        hit = self.email_index.get(email_addr)
+        if hit:
+            return hit
+        if self.sync_email_index():
+            return self.email_index.get(email_addr)
         return None
 
 
@@ -13,6 +13,18 @@ class Settings(BaseSettings):
     TELEGRAM_CHAT_ID: str = ""          # можно пусто — тогда бот отвечает всем
     TELEGRAM_POLLING: str = "0"         # "1" => включить long polling
     TELEGRAM_POLLING_INTERVAL: int = 2  # сек между запросами, если вдруг ошибка
+    TELEGRAM_CHAT_WORKERS: int = 4      # сколько чатов обрабатываем параллельно (внутри чата — по порядку)
+    TELEGRAM_FAST_WORKERS: int = 4      # потоки для команд вне очереди чата (/jobs, /cancel)
+    TELEGRAM_GLOBAL_RATE: float = 25.0  # сообщений/сек на бота (лимит телеги ~30)
+    TELEGRAM_CHAT_RATE: float = 1.0     # сообщений/сек в один чат
+    TELEGRAM_CHAT_BURST: int = 3        # столько можно отправить в чат разом, прежде чем сработает лимит
+    TELEGRAM_SEND_RETRIES: int = 3      # повторы на 429 (ждём retry_after)
+    TELEGRAM_COALESCE_SECONDS: float = 1.5  # окно склейки сообщений с coalesce=True
+
+    # --- фоновые задачи бота (/collect, /send, /replies) ---
+    JOBS_MAX_WORKERS: int = 4           # сколько задач крутится одновременно, остальные ждут
+    JOBS_PROGRESS_INTERVAL: float = 3.0 # сек — не чаще стольких правим сообщение с прогрессом
+    JOBS_HISTORY: int = 20              # сколько завершённых задач помним для /jobs
 
     # --- SMTP / почта ---
     SMTP_HOST: str = ""
@@ -20,6 +32,14 @@ class Settings(BaseSettings):
     SMTP_USERNAME: str = ""
     SMTP_PASSWORD: str = ""
     SMTP_FROM: str = ""
+    SMTP_POOL_SIZE: int = 2                     # сколько SMTP-соединений держим открытыми
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 50  # после стольких писем переподключаемся
+    SMTP_NOOP_AFTER_IDLE: int = 30              # сек простоя, после которых проверяем соединение NOOP
+
+    # --- рассылка (конвейер run_send) ---
+    SEND_SMTP_WORKERS: int = 0                 # 0 = по числу SMTP-соединений в пуле
+    SEND_RATE_PER_SEC: float = 2.5             # писем в секунду на всех (раньше пауза 0.4 сек)
+    SEND_CLICKUP_WORKERS: int = 4              # перевод задач в SENT
 
     # --- IMAP / «Отправленные» ---
     IMAP_HOST: str = ""                 # напр. imap.tapgrow.studio
@@ -27,11 +47,23 @@ class Settings(BaseSettings):
     IMAP_USERNAME: str = ""
     IMAP_PASSWORD: str = ""
     IMAP_SENT_FOLDER: str = ""          # напр. "Sent" | "Sent Items" | "Отправленные"; если пусто — определяется автоматически
+    IMAP_APPEND_BATCH: int = 20         # сколько копий писем пишем в «Отправленные» за раз
+    IMAP_APPEND_FLUSH_SECONDS: float = 2.0  # сколько ждём, пока наберётся пачка
     BCC_SELF: int = 0                   # 1 = добавлять BCC на свой адрес, 0 = выключено
 
     # --- валидация email ---
     EMAIL_VALIDATION_PROVIDER: str = ""  # например, "abstractapi"
     EMAIL_VALIDATION_API_KEY: str = ""
+    EMAIL_VALIDATION_BATCH_SIZE: int = 500       # адресов в одной задаче провайдера
+    EMAIL_VALIDATION_BATCH_TIMEOUT: int = 120    # сек ждём завершения задачи
+    EMAIL_VALIDATION_POLL_INTERVAL: float = 2.0  # сек между опросами статуса задачи
+    EMAIL_VALIDATION_CACHE_PATH: str = ""        # пусто — data/email_validation.sqlite3
+    EMAIL_VALIDATION_TTL_VALID_DAYS: float = 90     # сколько верим вердикту "валидный"
+    EMAIL_VALIDATION_TTL_INVALID_DAYS: float = 180  # сколько верим вердикту "невалидный"
+    EMAIL_LOCAL_VALIDATION: int = 1      # 1 = сначала локальные проверки (синтаксис, одноразовые, чёрный список, MX)
+    EMAIL_MX_CHECK: int = 1              # 1 = проверять MX (нужен dnspython)
+    EMAIL_MX_WORKERS: int = 16           # сколько доменов резолвим параллельно
+    EMAIL_BLACKLIST_PATTERNS: str = ""   # доп. regex-ы через ";", напр. "@competitor\.com$"
 
     # --- Google / сбор клиник ---
     GOOGLE_PLACES_API_KEY: str = ""      # нужно, чтобы leads.py увидел ключ
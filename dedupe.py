@@ -0,0 +1,165 @@
+# dedupe.py
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+# хвосты в названиях, которые не отличают одну клинику от другой
+_NAME_NOISE = {
+    "pc", "pllc", "llc", "lllp", "llp", "inc", "incorporated", "ltd", "co", "corp",
+    "corporation", "pa", "ps", "sc", "dds", "dmd", "ms", "the", "of", "and",
+}
+
+_ADDR_ABBR = {
+    "street": "st", "avenue": "ave", "road": "rd", "boulevard": "blvd", "drive": "dr",
+    "lane": "ln", "court": "ct", "place": "pl", "parkway": "pkwy", "highway": "hwy",
+    "suite": "ste", "north": "n", "south": "s", "east": "e", "west": "w",
+}
+
+# общие хостинги: один домен у тысяч разных клиник — по нему не склеиваем
+_SHARED_HOSTS = {
+    "facebook.com", "instagram.com", "sites.google.com", "business.site", "wixsite.com",
+    "squarespace.com", "godaddysites.com", "linktr.ee", "yelp.com", "zocdoc.com",
+}
+
+
+def _ascii_words(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    text = text.lower().replace("&", " and ")
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def name_tokens(name: str) -> Tuple[str, ...]:
+    """
+    "Bright Smile Dental, PC" -> ("bright", "smile", "dental")
+    """
+    return tuple(w for w in _ascii_words(name) if w not in _NAME_NOISE)
+
+
+def name_key(name: str) -> str:
+    tokens = name_tokens(name)
+    # название из одних "хвостов" — лучше уж как есть, чем пустой ключ
+    return " ".join(tokens) if tokens else " ".join(_ascii_words(name))
+
+
+def address_key(address: str) -> str:
+    """
+    Номер дома + ZIP: устойчиво к "Suite 200", "Street"/"St" и прочему форматированию.
+    Пусто, если чего-то из двух нет.
+    """
+    words = [_ADDR_ABBR.get(w, w) for w in _ascii_words(address)]
+    if not words:
+        return ""
+    number = words[0] if words[0].isdigit() else ""
+    zips = [w for w in words if len(w) == 5 and w.isdigit()]
+    zip_code = zips[-1] if zips else ""
+    if not (number and zip_code) or number == zip_code:
+        return ""
+    return f"{number} {zip_code}"
+
+
+def website_domain(url: str) -> str:
+    if not url:
+        return ""
+    host = urlparse(url if "://" in url else f"http://{url}").netloc.lower()
+    host = host.split(":")[0]
+    if host.startswith("www."):
+        host = host[4:]
+    if not host or host in _SHARED_HOSTS or any(host.endswith("." + h) for h in _SHARED_HOSTS):
+        return ""
+    return host
+
+
+def _jaccard(a: Tuple[str, ...], b: Tuple[str, ...]) -> float:
+    sa, sb = set(a), set(b)
+    if not sa or not sb:
+        return 0.0
+    return len(sa & sb) / len(sa | sb)
+
+
+class PlaceDedupeIndex:
+    """
+    Индекс для дедупа мест: нормализованное название, адрес (номер дома + ZIP), домен сайта.
+    Кандидатов ищем только по блокирующим ключам, поэтому на тысячах мест
+    сравнений почти линейное число.
+    """
+
+    def __init__(self, name_threshold: float = 0.8) -> None:
+        self.name_threshold = name_threshold
+        self._items: List[Dict[str, Any]] = []
+        self._blocks: Dict[str, List[int]] = {}
+        self._place_ids: Set[str] = set()
+
+    @staticmethod
+    def _features(place: Dict[str, Any]) -> Dict[str, Any]:
+        name = place.get("name") or ""
+        return {
+            "tokens": name_tokens(name),
+            "name": name_key(name),
+            "addr": address_key(place.get("address") or ""),
+            "domain": website_domain(place.get("website") or ""),
+        }
+
+    @staticmethod
+    def _block_keys(f: Dict[str, Any]) -> List[str]:
+        keys = []
+        if f["name"]:
+            keys.append("n:" + f["name"])
+        if f["addr"]:
+            keys.append("a:" + f["addr"])
+        if f["domain"]:
+            keys.append("d:" + f["domain"])
+        return keys
+
+    def _same(self, f: Dict[str, Any], g: Dict[str, Any]) -> bool:
+        same_addr = bool(f["addr"]) and f["addr"] == g["addr"]
+        no_addr = not f["addr"] or not g["addr"]
+        sim = _jaccard(f["tokens"], g["tokens"])
+
+        # одно название и тот же адрес (или адреса у кого-то нет)
+        if f["name"] and f["name"] == g["name"] and (same_addr or no_addr):
+            return True
+        # тот же сайт и тот же адрес / похожее название (у сетей сайт общий, адреса разные)
+        if f["domain"] and f["domain"] == g["domain"] and (same_addr or (no_addr and sim >= 0.5)):
+            return True
+        # по адресу совпали, и названия почти одинаковые
+        if same_addr and sim >= self.name_threshold:
+            return True
+        return False
+
+    def match(self, place: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Уже известное место, с которым совпадает place (или None).
+        """
+        f = self._features(place)
+        checked: Set[int] = set()
+        for key in self._block_keys(f):
+            for idx in self._blocks.get(key, ()):
+                if idx in checked:
+                    continue
+                checked.add(idx)
+                if self._same(f, self._items[idx]["f"]):
+                    return self._items[idx]["place"]
+        return None
+
+    def add(self, place: Dict[str, Any]) -> bool:
+        """
+        Добавляет место; False — если это дубль уже известного.
+        """
+        pid = place.get("place_id") or ""
+        if pid and pid in self._place_ids:
+            return False
+        if self.match(place) is not None:
+            return False
+
+        f = self._features(place)
+        idx = len(self._items)
+        self._items.append({"place": place, "f": f})
+        for key in self._block_keys(f):
+            self._blocks.setdefault(key, []).append(idx)
+        if pid:
+            self._place_ids.add(pid)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,94 @@
+# email_index.py
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from storage import db_path, open_sqlite
+
+log = logging.getLogger("email_index")
+
+EMAIL_INDEX_PATH = os.getenv("EMAIL_INDEX_PATH", "") or db_path("email_index.sqlite3")
+
+
+class EmailIndex:
+    """
+    Постоянный индекс email -> задача ClickUp (task_id, list_id, list_name, clinic_name).
+    Плюс отметка, до какого момента (ms) каждый лист уже просканирован.
+    """
+
+    def __init__(self, path: str = EMAIL_INDEX_PATH) -> None:
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS emails (
+                    email TEXT PRIMARY KEY,
+                    task_id TEXT NOT NULL,
+                    list_id TEXT NOT NULL,
+                    list_name TEXT NOT NULL DEFAULT '',
+                    clinic_name TEXT NOT NULL DEFAULT '',
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS emails_task ON emails(task_id)")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS list_sync (
+                    list_id TEXT PRIMARY KEY,
+                    synced_ms INTEGER NOT NULL
+                )
+                """
+            )
+
+    def get(self, email_addr: str) -> Optional[Dict[str, Any]]:
+        key = (email_addr or "").strip().lower()
+        if not key:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_id, list_id, list_name, clinic_name FROM emails WHERE email = ?",
+                (key,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def put(
+        self,
+        email_addr: Optional[str],
+        task_id: str,
+        list_id: str,
+        list_name: str = "",
+        clinic_name: str = "",
+    ) -> None:
+        """
+        Привязывает email к задаче. Старые адреса этой задачи удаляются —
+        у задачи один актуальный email (тот, что в description).
+        """
+        key = (email_addr or "").strip().lower()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM emails WHERE task_id = ?", (task_id,))
+            if key:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO emails VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, task_id, list_id, list_name or "", clinic_name or "", time.time()),
+                )
+
+    def last_sync_ms(self, list_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_ms FROM list_sync WHERE list_id = ?", (list_id,)
+            ).fetchone()
+        return int(row["synced_ms"]) if row else 0
+
+    def set_last_sync_ms(self, list_id: str, synced_ms: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO list_sync VALUES (?, ?)", (list_id, int(synced_ms))
+            )
+
+    def size(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0])
@@ -1,50 +1,397 @@
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+
 import requests
 from config import settings
 from requests.auth import HTTPBasicAuth
 
-def validate_email_if_needed(email: str) -> bool:
+from storage import db_path, open_sqlite
+
+try:  # MX-проверка — только если установлен dnspython
+    import dns.exception
+    import dns.resolver
+except ImportError:  # pragma: no cover
+    dns = None
+
+log = logging.getLogger("email_validator")
+
+VERIFALIA_URL = "https://api.verifalia.com/v2.4/email-validations"
+
+
+class ValidationCache:
     """
-    Возвращает True если email выглядит ок (валидный),
-    False если явно мусор, None если не смогли проверить.
+    Постоянный кэш вердиктов: адрес -> (вердикт, когда проверили, сколько верим).
+    Валидные и невалидные живут каждый своё время (EMAIL_VALIDATION_TTL_*_DAYS);
+    протухшие строки чистим при открытии, чтобы база не росла бесконечно.
     """
-    provider = settings.EMAIL_VALIDATION_PROVIDER.lower()
 
-    if provider == "verifalia":
-        try:
-            url = "https://api.verifalia.com/v2.4/email-validations"
-            payload = {
-                "entries": [
-                    {"inputData": email}
-                ]
-            }
-            resp = requests.post(
-                url,
-                json=payload,
-                auth=HTTPBasicAuth(settings.EMAIL_VALIDATION_API_KEY, ""),
-                timeout=15
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    email TEXT PRIMARY KEY,
+                    valid INTEGER NOT NULL,
+                    checked_at REAL NOT NULL,
+                    ttl REAL NOT NULL
+                )
+                """
             )
-            resp.raise_for_status()
-            data = resp.json()
-
-            # Verifalia складывает результаты в entries[0].classification.result
-            # но структура может меняться, поэтому читаем максимально безопасно
-            entry = data.get("entries", [{}])[0]
-            status = entry.get("classification", {}).get("result") or entry.get("status")
-
-            # допустим valid / deliverable / ok -> True
-            if status:
-                status_low = str(status).lower()
-                if "ok" in status_low or "deliverable" in status_low or "success" in status_low or "valid" in status_low:
-                    return True
-                if "undeliverable" in status_low or "invalid" in status_low or "rejected" in status_low:
-                    return False
-
-            # если не поняли ответ - не блокируем
-            return True
+        purged = self.purge_expired()
+        if purged:
+            log.info("email validation cache: purged %d expired verdicts", purged)
 
-        except Exception:
-            # не обрушать пайплайн если Verifalia не отвечает
+    def get_many(self, emails: List[str]) -> Dict[str, bool]:
+        """
+        Свежие вердикты для тех адресов, что есть в кэше (ключи — в нижнем регистре).
+        """
+        out: Dict[str, bool] = {}
+        keys = [e.strip().lower() for e in emails if e and e.strip()]
+        now = time.time()
+        with self._lock:
+            # sqlite не любит слишком длинные IN (...) — идём кусками
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT email, valid, checked_at, ttl FROM verdicts WHERE email IN ({marks})",
+                    part,
+                ).fetchall()
+                for row in rows:
+                    if row["checked_at"] + row["ttl"] > now:
+                        out[row["email"]] = bool(row["valid"])
+        return out
+
+    def put_many(self, verdicts: Dict[str, bool]) -> None:
+        if not verdicts:
+            return
+        now = time.time()
+        ttl_valid = float(settings.EMAIL_VALIDATION_TTL_VALID_DAYS) * 86400
+        ttl_invalid = float(settings.EMAIL_VALIDATION_TTL_INVALID_DAYS) * 86400
+        rows = [
+            (e.strip().lower(), int(ok), now, ttl_valid if ok else ttl_invalid)
+            for e, ok in verdicts.items()
+            if e and e.strip()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)", rows)
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM verdicts WHERE checked_at + ttl <= ?", (time.time(),))
+            return cur.rowcount
+
+
+# ===== локальная проверка (без платного провайдера) =====
+
+_EMAIL_RE = re.compile(
+    r"^[a-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[a-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}$"
+)
+
+# одноразовые ящики — на такие клиники не пишут
+DISPOSABLE_DOMAINS = {
+    "mailinator.com", "guerrillamail.com", "guerrillamail.net", "10minutemail.com",
+    "tempmail.com", "temp-mail.org", "throwawaymail.com", "yopmail.com", "trashmail.com",
+    "getnada.com", "dispostable.com", "maildrop.cc", "sharklasers.com", "fakeinbox.com",
+    "mintemail.com", "mailnesia.com", "mohmal.com", "emailondeck.com", "tempr.email",
+}
+
+# адреса, которые парсер сайтов часто принимает за email, и служебные ящики.
+# info@/office@ и прочие "ролевые" НЕ режем — у клиник это как раз рабочий контакт.
+_BLACKLIST_PATTERNS = [
+    r"^(no-?reply|do-?not-?reply|donotreply|mailer-daemon|postmaster|abuse|bounces?)@",
+    r"@(example|domain|email|yourdomain|yoursite|website)\.(com|org|net)$",
+    r"^(your|you|name|first|firstname|user|username|email)(\.?name)?@",
+    r"@(sentry|sentry-next)\.wixpress\.com$",
+    r"@sentry\.io$",
+    r"\.(png|jpe?g|gif|webp|svg|css|js)$",
+]
+
+
+def _compile_patterns(patterns: Iterable[str], source: str) -> List[Pattern[str]]:
+    """
+    Компилируем один раз; битый regex пишем в лог и пропускаем, а не роняем рассылку.
+    """
+    out: List[Pattern[str]] = []
+    for p in patterns:
+        try:
+            out.append(re.compile(p))
+        except re.error as e:
+            log.error("email blacklist: skip invalid pattern %r from %s: %s", p, source, e)
+    return out
+
+
+def _extra_blacklist() -> List[str]:
+    raw = settings.EMAIL_BLACKLIST_PATTERNS or ""
+    return [p.strip() for p in raw.split(";") if p.strip()]
+
+
+_BLACKLIST_RES = _compile_patterns(_BLACKLIST_PATTERNS, "built-in") + _compile_patterns(
+    _extra_blacklist(), "EMAIL_BLACKLIST_PATTERNS"
+)
+
+
+class MXResolver:
+    """
+    Есть ли у домена MX (или хотя бы A) — с кэшем на mx_ttl секунд.
+    lookup можно подменить (например, в тестах): домен -> True/False/None.
+    """
+
+    def __init__(self, lookup: Optional[Callable[[str], Optional[bool]]] = None, ttl: float = 86400) -> None:
+        self.lookup = lookup or self._dns_lookup
+        self.ttl = ttl
+        self._cache: Dict[str, Tuple[float, Optional[bool]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _dns_lookup(domain: str) -> Optional[bool]:
+        if dns is None:
+            return None
+        try:
+            dns.resolver.resolve(domain, "MX", lifetime=5)
             return True
+        except dns.resolver.NXDOMAIN:
+            return False
+        except dns.resolver.NoAnswer:
+            # без MX почта идёт на A-запись (RFC 5321)
+            try:
+                dns.resolver.resolve(domain, "A", lifetime=5)
+                return True
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                return False
+            except dns.exception.DNSException:
+                return None
+        except dns.exception.DNSException:
+            return None
+
+    def has_mail_host(self, domain: str) -> Optional[bool]:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(domain)
+            if hit and hit[0] > now:
+                return hit[1]
+        res = self.lookup(domain)
+        if res is not None:
+            # "не знаем" не кэшируем — DNS мог просто моргнуть
+            with self._lock:
+                self._cache[domain] = (now + self.ttl, res)
+        return res
+
+
+mx_resolver = MXResolver()
+
+
+def set_mx_resolver(resolver: MXResolver) -> None:
+    global mx_resolver
+    mx_resolver = resolver
+
+
+def local_verdict(email: str, check_mx: bool = True) -> Optional[bool]:
+    """
+    Что можно решить без сети провайдера:
+    False — точно мусор (синтаксис, одноразовый домен, чёрный список, нет MX),
+    None — неясно, решает провайдер.
+    check_mx=False — без DNS (пачкой MX проверяет validate_emails_batch).
+    """
+    addr = (email or "").strip().lower()
+    if not addr or len(addr) > 254 or addr.count("@") != 1:
+        return False
+    local, domain = addr.split("@")
+    if len(local) > 64 or not _EMAIL_RE.match(addr):
+        return False
+    if domain in DISPOSABLE_DOMAINS or any(domain.endswith("." + d) for d in DISPOSABLE_DOMAINS):
+        return False
+    if any(p.search(addr) for p in _BLACKLIST_RES):
+        return False
+    if check_mx and int(settings.EMAIL_MX_CHECK) and mx_resolver.has_mail_host(domain) is False:
+        return False
+    return None
+
+
+def _domains_without_mail_host(domains: Iterable[str]) -> set:
+    """
+    Домены без MX/A. Резолвим уникальные домены параллельно (EMAIL_MX_WORKERS),
+    а не по одному на адрес.
+    """
+    todo = sorted(set(domains))
+    if not todo:
+        return set()
+    workers = max(1, min(int(settings.EMAIL_MX_WORKERS), len(todo)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mx") as pool:
+        found = list(pool.map(mx_resolver.has_mail_host, todo))
+    return {d for d, ok in zip(todo, found) if ok is False}
+
+
+_cache: Optional[ValidationCache] = None
+_cache_lock = threading.Lock()
+
+
+def validation_cache() -> ValidationCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = settings.EMAIL_VALIDATION_CACHE_PATH or db_path("email_validation.sqlite3")
+            _cache = ValidationCache(path)
+        return _cache
+
+
+def _verdict(status: Any) -> Optional[bool]:
+    """
+    True — адрес ок, False — явно мусор, None — не поняли ответ.
+    Сначала проверяем "плохие" слова: "undeliverable" содержит "deliverable",
+    а "invalid" — "valid".
+    """
+    if not status:
+        return None
+    status_low = str(status).lower()
+    if "undeliverable" in status_low or "invalid" in status_low or "rejected" in status_low:
+        return False
+    if "ok" in status_low or "deliverable" in status_low or "success" in status_low or "valid" in status_low:
+        return True
+    return None
+
+
+def _entry_status(entry: Dict[str, Any]) -> Any:
+    # Verifalia отдаёт classification то строкой, то объектом — читаем максимально безопасно
+    cls = entry.get("classification")
+    if isinstance(cls, dict):
+        cls = cls.get("result")
+    return cls or entry.get("status")
+
+
+def _entries_page(data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    entries бывают списком или страницей {"data": [...], "meta": {"cursor", "isTruncated"}}.
+    Возвращает записи и курсор следующей страницы (если есть).
+    """
+    entries = data.get("entries") or []
+    cursor = None
+    if isinstance(entries, dict):
+        meta = entries.get("meta") or {}
+        if meta.get("isTruncated"):
+            cursor = meta.get("cursor")
+        entries = entries.get("data") or []
+    return [e for e in (entries or []) if isinstance(e, dict)], cursor
+
+
+def _verifalia_job(emails: List[str]) -> Dict[str, Optional[bool]]:
+    """
+    Одна задача Verifalia на всю пачку: отправляем, ждём завершения
+    (202 -> опрашиваем), собираем вердикты по всем страницам entries.
+    """
+    auth = HTTPBasicAuth(settings.EMAIL_VALIDATION_API_KEY, "")
+    resp = requests.post(
+        VERIFALIA_URL,
+        json={"entries": [{"inputData": e} for e in emails]},
+        auth=auth,
+        timeout=30,
+    )
+    resp.raise_for_status()
+    data = resp.json()
+
+    job_id = (data.get("overview") or {}).get("id")
+    deadline = time.monotonic() + float(settings.EMAIL_VALIDATION_BATCH_TIMEOUT)
+    while resp.status_code == 202 and job_id:
+        if time.monotonic() >= deadline:
+            log.warning("verifalia: job %s not finished in time", job_id)
+            break
+        time.sleep(float(settings.EMAIL_VALIDATION_POLL_INTERVAL))
+        resp = requests.get(f"{VERIFALIA_URL}/{job_id}", auth=auth, timeout=30)
+        resp.raise_for_status()
+        data = resp.json()
+
+    out: Dict[str, Optional[bool]] = {}
+    entries, cursor = _entries_page(data)
+    while True:
+        for entry in entries:
+            addr = (entry.get("inputData") or "").strip().lower()
+            if addr:
+                out[addr] = _verdict(_entry_status(entry))
+        if not (cursor and job_id):
+            break
+        page = requests.get(
+            f"{VERIFALIA_URL}/{job_id}/entries", params={"cursor": cursor}, auth=auth, timeout=30
+        )
+        page.raise_for_status()
+        entries, cursor = _entries_page({"entries": page.json()})
+    return out
+
+
+def validate_emails_batch(emails: Iterable[str]) -> Dict[str, bool]:
+    """
+    Проверяет пачку адресов одной (или несколькими, если пачка большая) задачей провайдера.
+    Возвращает {адрес в нижнем регистре: True/False}. Всё, что не смогли проверить
+    или не поняли, считаем валидным — как и раньше, не блокируем пайплайн.
+    """
+    unique: List[str] = []
+    seen = set()
+    for e in emails:
+        key = (e or "").strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(key)
+
+    result: Dict[str, bool] = {e: True for e in unique}
+    provider = settings.EMAIL_VALIDATION_PROVIDER.lower()
+
+    # локальный уровень: явный мусор отсекаем сразу, провайдеру — только неясное
+    ambiguous = unique
+    if int(settings.EMAIL_LOCAL_VALIDATION):
+        ambiguous = []
+        for e in unique:
+            if local_verdict(e, check_mx=False) is False:
+                result[e] = False
+            else:
+                ambiguous.append(e)
+        if ambiguous and int(settings.EMAIL_MX_CHECK):
+            dead = _domains_without_mail_host(e.split("@", 1)[1] for e in ambiguous)
+            if dead:
+                for e in ambiguous:
+                    if e.split("@", 1)[1] in dead:
+                        result[e] = False
+                ambiguous = [e for e in ambiguous if result[e]]
+
+    if provider == "verifalia" and ambiguous:
+        # что уже проверяли и ещё не протухло — провайдеру не отдаём
+        cache = validation_cache()
+        cached = cache.get_many(ambiguous)
+        result.update(cached)
+        todo = [e for e in ambiguous if e not in cached]
+        log.info(
+            "email validation: %d rejected locally, %d cached, %d to provider",
+            len(unique) - len(ambiguous), len(cached), len(todo),
+        )
+
+        chunk = max(1, int(settings.EMAIL_VALIDATION_BATCH_SIZE))
+        for i in range(0, len(todo), chunk):
+            part = todo[i:i + chunk]
+            try:
+                verdicts = _verifalia_job(part)
+            except Exception as e:
+                # не обрушать пайплайн если Verifalia не отвечает
+                log.warning("verifalia: batch of %d failed: %s", len(part), e)
+                continue
+            # кэшируем только внятные ответы; "не поняли" спросим в следующий раз
+            known = {a: ok for a, ok in verdicts.items() if ok is not None and a in result}
+            cache.put_many(known)
+            for addr, ok in known.items():
+                result[addr] = ok
 
     # fallback: если не знаем провайдера — просто пропускаем проверку
-    return True
+    return result
+
+
+def validate_email_if_needed(email: str) -> bool:
+    """
+    Возвращает True если email выглядит ок (валидный),
+    False если явно мусор. Если не смогли проверить — тоже True.
+    """
+    key = (email or "").strip().lower()
+    return validate_emails_batch([key]).get(key, True)
@@ -2,7 +2,13 @@
 import os
 import logging
 import requests
-from typing import List, Dict, Any
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+
+from geo import Rect, rect_restriction, split_rect
+from places_cache import PlacesCache
+from ratelimit import RateLimiter
+from storage import db_path
 
 log = logging.getLogger("google_places")
 
@@ -16,9 +22,94 @@ API_KEY = (
 # ===== НОВЫЙ ЭНДПОИНТ ДЛЯ PLACES API (NEW) =====
 BASE_URL = "https://places.googleapis.com/v1/places:searchText"
 
+# сколько запросов к Places гоняем параллельно и не чаще скольких в секунду (на весь клиент)
+PLACES_CONCURRENCY = int(os.getenv("PLACES_CONCURRENCY", "4"))
+PLACES_QPS = float(os.getenv("PLACES_QPS", "5"))
+# страниц на запрос (по 20 мест; Google отдаёт не больше 3)
+PLACES_MAX_PAGES = int(os.getenv("PLACES_MAX_PAGES", "3"))
+# тайлинг: насколько глубоко делим плотные квадраты и сколько тайлов максимум на запрос
+PLACES_TILE_MAX_DEPTH = int(os.getenv("PLACES_TILE_MAX_DEPTH", "4"))
+PLACES_MAX_TILES = int(os.getenv("PLACES_MAX_TILES", "64"))
+# кэш ответов на диске: повторный /collect и dev-прогоны не платят за те же запросы
+PLACES_CACHE = os.getenv("PLACES_CACHE", "1") == "1"
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", str(7 * 86400)))
+PLACES_CACHE_PATH = os.getenv("PLACES_CACHE_PATH", "") or db_path("places_cache.sqlite3")
+
+
+# ВАЖНО: Маска полей. Указываем, ЧТО мы хотим получить.
+# id = (старый place_id), displayName = (старое name)
+FIELD_MASK = "places.id,places.displayName,places.formattedAddress,places.websiteUri,nextPageToken"
+
+
+def _page_payload(
+    query: str,
+    page_token: Optional[str] = None,
+    location_restriction: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Тело запроса searchText (БЕЗ fieldMask — она идёт заголовком).
+    """
+    payload: Dict[str, Any] = {
+        "textQuery": query,
+        "pageSize": 20,  # Это максимум для одной страницы searchText
+    }
+    if location_restriction:
+        payload["locationRestriction"] = location_restriction
+    if page_token:
+        payload["pageToken"] = page_token
+    return payload
+
+
+def _cache_key(
+    query: str,
+    location_restriction: Optional[Dict[str, Any]] = None,
+    max_pages: int = 1,
+) -> str:
+    """
+    Ключ кэша на весь запрос (все страницы сразу). Постранично не кэшируем:
+    nextPageToken из старой страницы 1 к живой странице 2 уже не подходит.
+    """
+    return PlacesCache.key(
+        query=query,
+        field_mask=FIELD_MASK,
+        location=location_restriction,
+        max_pages=max_pages,
+    )
+
+
+def _to_place(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Место из ответа Places API (New) -> наш формат (как было у старого API).
+    """
+    # 'name' теперь в 'displayName'
+    name_data = item.get("displayName")
+    name = name_data.get("text") if isinstance(name_data, dict) else str(name_data)
+
+    # 'place_id' теперь 'id'
+    place_id = item.get("id")
+    # 'formatted_address' теперь 'formattedAddress'
+    address = item.get("formattedAddress")
+    # 'website' теперь 'websiteUri' (и он теперь должен быть!)
+    website = item.get("websiteUri", "")
+
+    if not place_id or not name:
+        return None  # Пропускаем неполные данные
+
+    return {
+        "place_id": place_id,
+        "name": name,
+        "address": address,
+        "website": website,
+        # Соцсетей по-прежнему нет в этом поиске
+        "facebook": "",
+        "instagram": "",
+        "linkedin": "",
+        "source": "google",
+    }
+
 
 class GooglePlacesClient:
-    def __init__(self, api_key: str | None = None):
+    def __init__(self, api_key: str | None = None, qps: float | None = None):
         self.api_key = (api_key or API_KEY).strip()
         if not self.api_key:
             log.error("GooglePlacesClient: API key is empty! Set GOOGLE_PLACES_API_KEY or GOOGLE_API_KEY")
@@ -29,31 +120,32 @@ class GooglePlacesClient:
             "X-Goog-Api-Key": self.api_key,
             "Content-Type": "application/json"
         })
+        # сессия общая для всех потоков — пусть пул соединений это выдерживает
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, PLACES_CONCURRENCY))
+        self.session.mount("https://", adapter)
+        self.limiter = RateLimiter(PLACES_QPS if qps is None else qps)
+        self.cache: Optional[PlacesCache] = (
+            PlacesCache(PLACES_CACHE_PATH, PLACES_CACHE_TTL) if PLACES_CACHE else None
+        )
 
-    def _text_search(self, query: str) -> List[Dict[str, Any]]:
+    def _search_page(
+        self,
+        query: str,
+        page_token: Optional[str] = None,
+        location_restriction: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Tuple[List[Dict[str, Any]], Optional[str]]]:
         """
-        Выполняет ОДИН запрос к searchText.
-        Пейджинг здесь не поддерживается со стороны Google.
+        Одна страница searchText (до 20 мест) + токен следующей страницы.
+        None — запрос не удался (такой результат не кэшируем).
         """
-        if not self.api_key:
-            return []
-
-        # ВАЖНО: Маска полей. Указываем, ЧТО мы хотим получить.
-        # id = (старый place_id), displayName = (старое name)
-        field_mask = "places.id,places.displayName,places.formattedAddress,places.websiteUri"
-
-        # 1. Тело запроса (БЕЗ fieldMask)
-        payload = {
-            "textQuery": query,
-            "maxResultCount": 20,  # Это максимум для searchText
-        }
-        
-        # 2. Маска полей передается как HTTP-заголовок
+        payload = _page_payload(query, page_token, location_restriction)
+        # Маска полей передается как HTTP-заголовок
         headers = {
-            "X-Goog-FieldMask": field_mask
+            "X-Goog-FieldMask": FIELD_MASK
         }
 
         try:
+            self.limiter.acquire()
             # 3. Передаем и payload (json), и headers
             r = self.session.post(
                 BASE_URL, 
@@ -65,8 +157,8 @@ class GooglePlacesClient:
             r.raise_for_status()
             
             data = r.json()
-            # Новый API возвращает { "places": [...] }
-            return data.get("places", [])
+            # Новый API возвращает { "places": [...], "nextPageToken": "..." }
+            return data.get("places", []), data.get("nextPageToken") or None
 
         except requests.exceptions.HTTPError as e:
             # Логируем ошибку, чтобы было понятнее
@@ -80,43 +172,164 @@ class GooglePlacesClient:
                      "!!! КРИТИЧНО: 'Places API (New)' не включен в Google Cloud Console. "
                      "Нужно зайти и включить именно 'Places API (New)'."
                  )
-            return []
+            return None
         except Exception as e:
             log.error("Google Places (New) generic error for query '%s': %s", query, e)
+            return None
+
+    def _text_search(
+        self,
+        query: str,
+        location_restriction: Optional[Dict[str, Any]] = None,
+        max_pages: Optional[int] = None,
+        force_refresh: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        searchText со всеми страницами (nextPageToken), но не больше max_pages.
+        Google отдаёт максимум 3 страницы по 20 мест на запрос.
+        Весь результат кэшируется на диске одним ключом (force_refresh — мимо кэша,
+        но результат сохраним); оборванный ошибкой проход не кэшируем.
+        """
+        if not self.api_key:
             return []
 
-    def search(self, query: str) -> List[Dict[str, Any]]:
+        pages = max(1, max_pages or PLACES_MAX_PAGES)
+        cache_key = None
+        if self.cache:
+            cache_key = _cache_key(query, location_restriction, pages)
+            if not force_refresh:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached.get("places", [])
+
+        out: List[Dict[str, Any]] = []
+        token: Optional[str] = None
+        complete = True
+        for _ in range(pages):
+            page = self._search_page(query, token, location_restriction)
+            if page is None:
+                complete = False
+                break
+            items, token = page
+            out.extend(items)
+            if not token:
+                break
+        if cache_key and complete:
+            self.cache.put(cache_key, {"places": out})
+        return out
+
+    def search(
+        self,
+        query: str,
+        location_restriction: Optional[Dict[str, Any]] = None,
+        force_refresh: bool = False,
+    ) -> List[Dict[str, Any]]:
         # Вызываем нашу новую функцию
-        raw_places = self._text_search(query)
+        raw_places = self._text_search(query, location_restriction, force_refresh=force_refresh)
         
-        places: List[Dict[str, Any]] = []
-        for item in raw_places:
-            # 'name' теперь в 'displayName'
-            name_data = item.get("displayName")
-            name = name_data.get("text") if isinstance(name_data, dict) else str(name_data)
-
-            # 'place_id' теперь 'id'
-            place_id = item.get("id")
-            # 'formatted_address' теперь 'formattedAddress'
-            address = item.get("formattedAddress")
-            # 'website' теперь 'websiteUri' (и он теперь должен быть!)
-            website = item.get("websiteUri", "")
-
-            if not place_id or not name:
-                continue  # Пропускаем неполные данные
-
-            places.append(
-                {
-                    "place_id": place_id,
-                    "name": name,
-                    "address": address,
-                    "website": website,
-                    # Соцсетей по-прежнему нет в этом поиске
-                    "facebook": "",
-                    "instagram": "",
-                    "linkedin": "",
-                    "source": "google",
-                }
-            )
+        places = [p for p in map(_to_place, raw_places) if p]
         log.info("google (new API) %r -> %d places", query, len(places))
         return places
+
+    def iter_search_many(
+        self,
+        queries: Iterable[str],
+        concurrency: Optional[int] = None,
+        force_refresh: bool = False,
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Гоняет несколько запросов параллельно (ограниченный пул потоков + общий QPS-лимит)
+        и отдаёт пары (запрос, места) по мере готовности — можно сразу писать в CRM.
+        """
+        queries = list(queries)
+        if not queries:
+            return
+        workers = max(1, min(len(queries), concurrency or PLACES_CONCURRENCY))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="places")
+        try:
+            futures = {pool.submit(self.search, q, None, force_refresh): q for q in queries}
+            for fut in as_completed(futures):
+                yield futures[fut], fut.result()
+        finally:
+            # если потребитель бросил генератор (отмена сбора) — не гоняем оставшиеся запросы
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def search_many(
+        self,
+        queries: Iterable[str],
+        concurrency: Optional[int] = None,
+        force_refresh: bool = False,
+    ) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        То же, что iter_search_many, но всё разом и в исходном порядке запросов.
+        """
+        queries = list(queries)
+        done = dict(self.iter_search_many(queries, concurrency, force_refresh))
+        return [(q, done.get(q, [])) for q in queries]
+
+    def iter_search_tiled(
+        self,
+        queries: Iterable[str],
+        bounds: Rect,
+        concurrency: Optional[int] = None,
+        force_refresh: bool = False,
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Поиск по области, порезанной на прямоугольники (locationRestriction).
+        Начинаем с одного прямоугольника на всю область; если тайл отдал "полный"
+        ответ (все страницы забиты — значит, мест там больше), делим его на 4
+        и ищем ещё раз, пока не упрёмся в PLACES_TILE_MAX_DEPTH / PLACES_MAX_TILES.
+        Отдаёт пары (запрос, новые места тайла) по мере готовности тайлов;
+        дочерние тайлы ставятся в работу сразу, не дожидаясь остальных.
+        """
+        saturated_at = 20 * max(1, PLACES_MAX_PAGES)
+        queries = list(queries)
+        seen: Dict[str, Set[str]] = {q: set() for q in queries}
+        tiles_used: Dict[str, int] = {q: 1 for q in queries}
+
+        workers = max(1, concurrency or PLACES_CONCURRENCY)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="places-tile")
+        try:
+            def _submit(q: str, rect: Rect, depth: int) -> None:
+                fut = pool.submit(self.search, q, rect_restriction(rect), force_refresh)
+                pending[fut] = (q, rect, depth)
+
+            pending: Dict[Any, Tuple[str, Rect, int]] = {}
+            for q in queries:
+                _submit(q, bounds, 0)
+
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    q, rect, depth = pending.pop(fut)
+                    places = fut.result()
+
+                    dense = len(places) >= saturated_at
+                    if dense and depth < PLACES_TILE_MAX_DEPTH and tiles_used[q] + 4 <= PLACES_MAX_TILES:
+                        tiles_used[q] += 4
+                        log.info("google tiles: %r dense at depth %d -> split", q, depth)
+                        for sub in split_rect(rect):
+                            _submit(q, sub, depth + 1)
+
+                    fresh = [p for p in places if p["place_id"] not in seen[q]]
+                    seen[q].update(p["place_id"] for p in fresh)
+                    if fresh:
+                        yield q, fresh
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def search_tiled(
+        self,
+        queries: Iterable[str],
+        bounds: Rect,
+        concurrency: Optional[int] = None,
+        force_refresh: bool = False,
+    ) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        То же, что iter_search_tiled, но разом: пары (запрос, места по всем тайлам без повторов).
+        """
+        queries = list(queries)
+        found: Dict[str, List[Dict[str, Any]]] = {q: [] for q in queries}
+        for q, places in self.iter_search_tiled(queries, bounds, concurrency, force_refresh):
+            found[q].extend(places)
+        return [(q, found[q]) for q in queries]
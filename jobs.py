@@ -0,0 +1,248 @@
+# jobs.py
+import time
+import html
+import logging
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+from telegram_notifier import edit_message, send_message as tg_send
+
+log = logging.getLogger("jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_STATUS_TEXT = {
+    QUEUED: "⏳ в очереди",
+    RUNNING: "▶️ идёт",
+    DONE: "✅ готово",
+    FAILED: "❌ ошибка",
+    CANCELLED: "⛔ отменено",
+}
+
+
+class Job:
+    """
+    Долгая операция бота (сбор, рассылка, разбор ответов) со своим номером.
+    Прогресс пишется в одно сообщение чата, которое правится не чаще
+    JOBS_PROGRESS_INTERVAL секунд (в телегу пишет общий поток _publisher,
+    поток задачи не ждёт). fn получает саму задачу: job.progress(...)
+    обновляет счётчики, job.cancelled() — просили ли отменить.
+    """
+
+    def __init__(
+        self,
+        job_id: int,
+        chat_id: int,
+        title: str,
+        fn: Callable[["Job"], str],
+        labels: Dict[str, str],
+        rate_key: Optional[str] = None,
+    ) -> None:
+        self.id = job_id
+        self.chat_id = chat_id
+        self.title = title
+        self.fn = fn
+        self.labels = labels
+        self.rate_key = rate_key
+        self.status = QUEUED
+        self.counters: Dict[str, int] = {}
+        self.result = ""
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.message_id: Optional[int] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._msg_lock = threading.Lock()
+        self._last_edit = 0.0
+
+    # --- для fn ---
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def progress(self, counters: Dict[str, int]) -> None:
+        with self._lock:
+            self.counters.update(counters)
+            if self.status != RUNNING:
+                return
+            now = time.monotonic()
+            if now - self._last_edit < float(settings.JOBS_PROGRESS_INTERVAL):
+                return
+            self._last_edit = now
+        self._publish()
+
+    # --- служебное ---
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def elapsed(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def summary(self) -> str:
+        """
+        Одна строка для /jobs.
+        """
+        line = f"#{self.id} {html.escape(self.title)} — {_STATUS_TEXT[self.status]}"
+        if self.started_at:
+            line += f", {int(self.elapsed())} сек"
+        if self.rate_key and self.counters.get(self.rate_key):
+            line += f", {self.labels.get(self.rate_key, self.rate_key).lower()}: {self.counters[self.rate_key]}"
+        return line
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self.counters)
+        lines = [f"<b>#{self.id} {html.escape(self.title)}</b> — {_STATUS_TEXT[self.status]}"]
+        if not self.result:
+            # итоговый отчёт и так содержит все цифры
+            for key, label in self.labels.items():
+                if key in counters:
+                    lines.append(f"{label}: {counters[key]}")
+        elapsed = self.elapsed()
+        if self.rate_key and elapsed >= 1:
+            per_min = counters.get(self.rate_key, 0) * 60.0 / elapsed
+            lines.append(f"Скорость: {per_min:.1f}/мин, прошло {int(elapsed)} сек")
+        if self.status == RUNNING:
+            lines.append(f"Отменить: /cancel {self.id}")
+        if self.result:
+            lines.append("")
+            lines.append(self.result)
+        return "\n".join(lines)
+
+    def _publish(self) -> None:
+        # не блокирует: сообщение обновит поток _publisher
+        _publisher.publish(self)
+
+    def _send_update(self) -> None:
+        text = self.render()
+        try:
+            # первое сообщение отправляется один раз, дальше только правки
+            with self._msg_lock:
+                if self.message_id is None:
+                    self.message_id = tg_send(self.chat_id, text, parse_mode="HTML")
+                else:
+                    edit_message(self.chat_id, self.message_id, text, parse_mode="HTML")
+        except Exception as e:
+            log.warning("jobs:#%s cannot publish progress: %s", self.id, e)
+
+
+class _Publisher:
+    """
+    Один поток, который пишет прогресс задач в телегу. Задача только отмечает,
+    что её сообщение устарело; текст берётся на момент отправки, поэтому
+    несколько обновлений подряд превращаются в одну правку, а медленный
+    (429) чат не держит потоки, которые шлют письма и пишут в ClickUp.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._dirty: "OrderedDict[int, Job]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, job: Job) -> None:
+        with self._cond:
+            self._dirty[job.id] = job
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="job-publisher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                _, job = self._dirty.popitem(last=False)
+            job._send_update()
+
+
+_publisher = _Publisher()
+
+
+class JobManager:
+    """
+    Запускает Job в фоне (не больше JOBS_MAX_WORKERS одновременно) и помнит
+    последние завершённые для /jobs.
+    """
+
+    def __init__(self, max_workers: int, history: int) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[int, Job]" = OrderedDict()
+        self._history = max(0, history)
+
+    def start(
+        self,
+        chat_id: int,
+        title: str,
+        fn: Callable[[Job], str],
+        labels: Optional[Dict[str, str]] = None,
+        rate_key: Optional[str] = None,
+    ) -> Job:
+        job = Job(next(self._ids), chat_id, title, fn, labels or {}, rate_key)
+        with self._lock:
+            self._jobs[job.id] = job
+        # сообщение с прогрессом появляется сразу — в нём же будет итог
+        job._publish()
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job) -> None:
+        if job.cancelled():
+            job.status = CANCELLED
+        else:
+            job.status = RUNNING
+            job.started_at = time.time()
+            job._publish()
+            try:
+                job.result = job.fn(job) or ""
+                job.status = CANCELLED if job.cancelled() else DONE
+            except Exception as e:
+                log.exception("jobs:#%s %s failed: %s", job.id, job.title, e)
+                job.result = f"Ошибка: {html.escape(str(e))}"
+                job.status = FAILED
+            job.finished_at = time.time()
+        log.info("jobs:#%s %s -> %s in %.1fs", job.id, job.title, job.status, job.elapsed())
+        job._publish()
+        self._trim()
+
+    def _trim(self) -> None:
+        with self._lock:
+            finished = [j.id for j in self._jobs.values() if j.status in (DONE, FAILED, CANCELLED)]
+            for job_id in finished[: max(0, len(finished) - self._history)]:
+                del self._jobs[job_id]
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, chat_id: Optional[int] = None) -> List[Job]:
+        with self._lock:
+            return [j for j in self._jobs.values() if chat_id is None or j.chat_id == chat_id]
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Просит задачу остановиться. Задача из очереди не запустится вовсе,
+        запущенная остановится на ближайшей проверке job.cancelled().
+        """
+        job = self.get(job_id)
+        if not job or job.status not in (QUEUED, RUNNING):
+            return False
+        job.cancel()
+        return True
+
+
+job_manager = JobManager(settings.JOBS_MAX_WORKERS, settings.JOBS_HISTORY)
@@ -1,13 +1,30 @@
 # leads.py
+import os
+import re
 import logging
-from typing import Dict, Any, List, Set, Tuple
+from typing import Dict, Any, Callable, List, Optional
 
+from dedupe import PlaceDedupeIndex
+from geo import STATE_BOUNDS
 from google_places import GooglePlacesClient
 from clickup_client import clickup_client
+from place_registry import PlaceRegistry
 
 log = logging.getLogger("leads")
 
 _gp = GooglePlacesClient()
+_registry = PlaceRegistry()
+
+# "1" => искать по тайлам внутри рамки штата вместо списка городов
+PLACES_TILING = os.getenv("PLACES_TILING", "0") == "1"
+
+# в режиме тайлинга штат задаёт прямоугольник, поэтому запросы без названий мест
+TILED_QUERIES = [
+    "dentist",
+    "dental clinic",
+    "orthodontist",
+    "pediatric dentist",
+]
 
 
 def _queries_for_state(state: str) -> List[str]:
@@ -52,66 +69,110 @@ def _queries_for_state(state: str) -> List[str]:
     ]
 
 
-def upsert_leads_for_state(state: str) -> Dict[str, int]:
+def _in_state(place: Dict[str, Any], state: str) -> bool:
+    # formattedAddress вида "123 Main St, Miami, FL 33101, USA"
+    return re.search(rf",\s*{re.escape(state.upper())}\s+\d{{5}}", place.get("address") or "") is not None
+
+
+def upsert_leads_for_state(
+    state: str,
+    force_refresh: bool = False,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> Dict[str, int]:
     """
     Главная функция, которую вызывает телеграм-бот.
     Возвращаем счётчики, чтобы бот написал в чат.
+    force_refresh — не брать ответы Google из кэша.
+    progress(счётчики) зовём после каждого ответа Google; cancelled() == True — сбор
+    останавливается, а уже созданное остаётся в ClickUp.
     """
     list_id = clickup_client.get_or_create_list_for_state(state)
-    queries = _queries_for_state(state)
-    log.info("leads:google (new) queries for %s -> %d queries", state, len(queries))
-
-    raw_places: List[Dict[str, Any]] = []
-    for q in queries:
-        places = _gp.search(q)
+    # индекс имён грузим один раз на сбор — дальше bulk_upsert_leads проверяет дубли в памяти
+    clickup_client.load_lead_index(list_id, refresh=True)
+    bounds = STATE_BOUNDS.get(state.upper())
+    tiled = PLACES_TILING and bounds is not None
+    if tiled:
+        log.info("leads:google (new) tiled search for %s -> %d queries", state, len(TILED_QUERIES))
+        results = _gp.iter_search_tiled(TILED_QUERIES, bounds, force_refresh=force_refresh)
+    else:
+        queries = _queries_for_state(state)
+        log.info("leads:google (new) queries for %s -> %d queries", state, len(queries))
+        # запросы идут параллельно — время сбора ≈ самый медленный запрос, а не сумма
+        results = _gp.iter_search_many(queries, force_refresh=force_refresh)
+
+    # дедуп по названию/адресу/сайту, а не только по точному (place_id, name)
+    seen = PlaceDedupeIndex()
+    found = 0
+    created = 0
+    skipped = 0
+    known = 0
+
+    # Пишем в ClickUp по мере готовности запросов: пока мы создаём задачи
+    # по первому ответу, остальные запросы к Google ещё идут в фоне.
+    for q, places in results:
+        if cancelled and cancelled():
+            log.info("leads: collect for %s cancelled", state)
+            break
+        if tiled:
+            # рамка штата задевает соседей — оставляем только адреса этого штата
+            places = [p for p in places if _in_state(p, state)]
         log.info("leads:google (new) %r -> %d places", q, len(places))
-        raw_places.extend(places)
 
-    # дедуп
-    seen: Set[Tuple[str, str]] = set()
-    unique_places: List[Dict[str, Any]] = []
-    for p in raw_places:
-        key = (p.get("place_id") or "", (p.get("name") or "").lower())
-        if key in seen:
-            continue
-        seen.add(key)
-        unique_places.append(p)
+        # места из прошлых сборов (любого штата) уже в ClickUp — не тратим на них запросы
+        registered = _registry.get_many(p.get("place_id") or "" for p in places)
 
-    log.info("leads:after dedupe -> %d places for %s", len(unique_places), state)
+        batch: List[Dict[str, Any]] = []
+        for p in places:
+            if not seen.add(p):
+                continue
+            found += 1
 
-    created = 0
-    skipped = 0
-
-    for p in unique_places:
-        try:
-            lead = {
-                "name": p.get("name") or "Clinic",
-                "address": p.get("address") or "",
-                "website": p.get("website") or "",
-                "facebook": p.get("facebook") or "",
-                "instagram": p.get("instagram") or "",
-                "linkedin": p.get("linkedin") or "",
-                "source": p.get("source") or "google",
-                "status": "NEW",
-            }
-            
-            # ===== 🟢 ВОТ ИСПРАВЛЕНИЕ СЧЕТЧИКА 🟢 =====
-            # upsert_lead вернет True (если создал) или False (если пропустил дубликат)
-            was_created = clickup_client.upsert_lead(list_id, lead)
-            
-            if was_created:
-                created += 1
-            else:
-                # Считаем пропущенные дубликаты как 'skipped'
+            if p.get("place_id") in registered:
+                known += 1
                 skipped += 1
-            # ===== 🟢 КОНЕЦ ИСПРАВЛЕНИЯ 🟢 =====
-
-        except Exception as e:
-            log.warning("leads: cannot upsert %s: %s", p.get("name"), e)
-            skipped += 1
+                continue
+            batch.append(p)
+
+        if batch:
+            leads = [
+                {
+                    "name": p.get("name") or "Clinic",
+                    "address": p.get("address") or "",
+                    "website": p.get("website") or "",
+                    "facebook": p.get("facebook") or "",
+                    "instagram": p.get("instagram") or "",
+                    "linkedin": p.get("linkedin") or "",
+                    "source": p.get("source") or "google",
+                    "status": "NEW",
+                }
+                for p in batch
+            ]
+            # вся пачка запроса пишется параллельно; дубли по названию отсеет bulk_upsert_leads
+            try:
+                upserted = clickup_client.bulk_upsert_leads(list_id, leads, cancelled=cancelled)
+            except Exception as e:
+                log.warning("leads: cannot upsert batch of %d for %r: %s", len(leads), q, e)
+                upserted = [{"status": "failed", "task_id": None}] * len(leads)
+
+            for p, res in zip(batch, upserted):
+                if res["status"] == "created":
+                    created += 1
+                else:
+                    # дубликаты, ошибки и отменённые считаем как 'skipped'
+                    skipped += 1
+                # и созданное, и найденный дубль запоминаем — в следующий раз пропустим сразу
+                if res.get("task_id"):
+                    _registry.put(p.get("place_id") or "", state, list_id, res["task_id"])
+
+        if progress:
+            progress({"found": found, "created": created, "skipped": skipped})
+
+    log.info("leads:after dedupe -> %d places for %s (%d already known)", found, state, known)
 
     return {
-        "found": len(unique_places),
+        "found": found,
         "created": created,
         "skipped": skipped,
+        "known": known,
     }
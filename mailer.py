@@ -4,7 +4,11 @@ import imaplib
 import logging
 import re
 import json
-from typing import Optional, List
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, List
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr, formatdate, make_msgid
@@ -227,83 +231,382 @@ def build_email_text(clinic_name: str, clinic_site: Optional[str]) -> str:
     )
 
 
-def _append_to_imap_sent(msg_obj) -> None:
-    """Кладёт копию письма в IMAP «Отправленные», если заданы IMAP_*."""
-    host = getattr(settings, "IMAP_HOST", "") or ""
-    user = getattr(settings, "IMAP_USERNAME", "") or ""
-    pwd  = getattr(settings, "IMAP_PASSWORD", "") or ""
-    default_box = (getattr(settings, "IMAP_SENT_FOLDER", "") or "").strip()
-    port = getattr(settings, "IMAP_PORT", 993)
-    try:
-        port = int(port)
-    except Exception:
-        port = 993
-
-    if not (host and user and pwd):
-        log.info("IMAP append skipped: IMAP creds not configured")
-        return
+_SENT_CANDIDATES = ["INBOX.Sent", "Sent", "Sent Items", "Отправленные", "Sent Messages", "[Gmail]/Sent Mail"]
+
+
+class ImapSentAppender:
+    """
+    Фоновая запись копий писем в IMAP «Отправленные».
+    Одно долгоживущее IMAP-соединение, папка определяется один раз,
+    письма копятся в очереди и пишутся пачками (MULTIAPPEND, если сервер умеет).
+    SMTP-путь только кладёт письмо в очередь и не ждёт IMAP.
+    """
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[bytes]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._conn: Optional[imaplib.IMAP4_SSL] = None
+        self._sent_box: Optional[str] = None
+        self._last_used = 0.0
+
+    # ---- настройки ----
+
+    @staticmethod
+    def _creds():
+        host = getattr(settings, "IMAP_HOST", "") or ""
+        user = getattr(settings, "IMAP_USERNAME", "") or ""
+        pwd  = getattr(settings, "IMAP_PASSWORD", "") or ""
+        port = getattr(settings, "IMAP_PORT", 993)
+        try:
+            port = int(port)
+        except Exception:
+            port = 993
+        return host, port, user, pwd
+
+    def configured(self) -> bool:
+        host, _, user, pwd = self._creds()
+        return bool(host and user and pwd)
+
+    # ---- очередь ----
+
+    def enqueue(self, raw_bytes: bytes) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="imap-sent", daemon=True)
+                self._thread.start()
+        self._queue.put(raw_bytes)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """
+        Ждём, пока очередь разберётся (например, перед остановкой процесса).
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
 
-    try:
+    def _run(self) -> None:
+        batch_size = max(1, int(settings.IMAP_APPEND_BATCH))
+        linger = float(settings.IMAP_APPEND_FLUSH_SECONDS)
+        while True:
+            batch = [self._queue.get()]
+            # даём пачке набраться, но не дольше linger секунд
+            deadline = time.monotonic() + linger
+            while len(batch) < batch_size:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=left))
+                except queue.Empty:
+                    break
+            try:
+                self._flush_batch(batch)
+            except Exception as e:
+                log.warning("IMAP append failed: %s", e)
+                self._drop_conn()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    # ---- IMAP ----
+
+    def _drop_conn(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.logout()
+            except Exception:
+                pass
+        self._conn = None
+
+    def _connection(self) -> imaplib.IMAP4_SSL:
+        if self._conn is not None:
+            # после простоя проверяем, что соединение живо
+            if time.monotonic() - self._last_used < 60:
+                return self._conn
+            try:
+                if self._conn.noop()[0] == "OK":
+                    return self._conn
+            except Exception:
+                pass
+            self._drop_conn()
+
+        host, port, user, pwd = self._creds()
         m = imaplib.IMAP4_SSL(host, port)
         m.login(user, pwd)
-
-        # 1) Определяем папку «Отправленные»
-        sent_box = default_box or None
-        if not sent_box:
-            typ, data = m.list()
-            if typ == "OK" and data:
-                for raw in data:
-                    line = raw.decode("utf-8", errors="ignore")
-                    if r"\Sent" in line:
-                        parts = line.split(' "/" ')
-                        if len(parts) == 2:
-                            sent_box = parts[1].strip().strip('"')
-                            break
-        if not sent_box:
-            for name in ["INBOX.Sent", "Sent", "Sent Items", "Отправленные", "Sent Messages", "[Gmail]/Sent Mail"]:
+        # в приветствии до логина часть серверов (Dovecot) не показывает
+        # MULTIAPPEND/LITERAL+ — перечитываем список возможностей
+        try:
+            typ, data = m.capability()
+            if typ == "OK" and data and data[-1]:
+                m.capabilities = tuple(data[-1].decode("ascii", errors="ignore").upper().split())
+        except Exception as e:
+            log.debug("IMAP CAPABILITY after login failed: %s", e)
+        self._conn = m
+        return m
+
+    def _detect_sent_box(self, m: imaplib.IMAP4_SSL) -> Optional[str]:
+        default_box = (getattr(settings, "IMAP_SENT_FOLDER", "") or "").strip()
+        if default_box:
+            return default_box
+
+        typ, data = m.list()
+        if typ == "OK" and data:
+            for raw in data:
+                line = raw.decode("utf-8", errors="ignore") if isinstance(raw, bytes) else str(raw)
+                if r"\Sent" in line:
+                    parts = line.split(' "/" ')
+                    if len(parts) == 2:
+                        return parts[1].strip().strip('"')
+
+        for name in _SENT_CANDIDATES:
+            try:
+                if m.select(f'"{name}"')[0] == "OK":
+                    return name
+            except Exception:
+                pass
+        return None
+
+    def _multiappend(self, m: imaplib.IMAP4_SSL, box: str, batch: List[bytes]):
+        """
+        MULTIAPPEND (RFC 3502) одной командой. imaplib сам так не умеет,
+        поэтому шлём команду руками; нужен ещё LITERAL+, чтобы не ждать
+        продолжения от сервера на каждом литерале. Переводы строк приводим
+        к CRLF, как это делает m.append (as_bytes() отдаёт голые LF).
+        """
+        tag = m._new_tag()
+        parts = [tag, b" APPEND ", m._quote(box).encode("utf-8")]
+        for raw in batch:
+            literal = imaplib.MapCRLF.sub(imaplib.CRLF, raw)
+            parts.append(b" (\\Seen) {%d+}\r\n" % len(literal))
+            parts.append(literal)
+        parts.append(b"\r\n")
+        m.tagged_commands[tag] = None
+        m.send(b"".join(parts))
+        return m._command_complete("APPEND", tag)
+
+    @staticmethod
+    def _can_multiappend(m: imaplib.IMAP4_SSL) -> bool:
+        caps = set(getattr(m, "capabilities", ()) or ())
+        if "MULTIAPPEND" not in caps or "LITERAL+" not in caps:
+            return False
+        # внутренности imaplib, на которые опирается _multiappend
+        return all(hasattr(m, a) for a in ("_new_tag", "_quote", "send", "_command_complete", "tagged_commands"))
+
+    def _append_batch(self, m: imaplib.IMAP4_SSL, box: str, batch: List[bytes]) -> List[bytes]:
+        """
+        Пишет пачку в box. Возвращает письма, которые записать не удалось
+        (пустой список — всё записано), чтобы повторять только их.
+        """
+        if len(batch) > 1 and self._can_multiappend(m):
+            try:
+                resp = self._multiappend(m, box, batch)
+                # MULTIAPPEND атомарен: либо вся пачка, либо ничего
+                if resp and resp[0] == "OK":
+                    return []
+                log.warning("IMAP MULTIAPPEND returned %s, falling back to single APPEND", resp and resp[0])
+            except Exception as e:
+                # состояние соединения после оборванной команды неизвестно — открываем новое
+                log.warning("IMAP MULTIAPPEND failed (%s), falling back to single APPEND", e)
+                self._drop_conn()
                 try:
-                    if m.select(f'"{name}"')[0] == "OK":
-                        sent_box = name
-                        break
-                except Exception:
-                    pass
-
-        if not sent_box:
-            log.warning("IMAP append skipped: can't detect Sent folder")
-            m.logout()
+                    m = self._connection()
+                except Exception as e2:
+                    log.warning("IMAP reconnect failed: %s", e2)
+                    return list(batch)
+
+        failed: List[bytes] = []
+        for i, raw in enumerate(batch):
+            try:
+                resp = m.append(box, r"(\Seen)", None, raw)
+            except Exception as e:
+                log.warning("IMAP APPEND to '%s' failed: %s", box, e)
+                failed.append(raw)
+                self._drop_conn()
+                try:
+                    m = self._connection()
+                except Exception as e2:
+                    log.warning("IMAP reconnect failed: %s", e2)
+                    failed.extend(batch[i + 1:])
+                    break
+                continue
+            if not resp or resp[0] != "OK":
+                failed.append(raw)
+        return failed
+
+    def _flush_batch(self, batch: List[bytes]) -> None:
+        m = self._connection()
+        self._last_used = time.monotonic()
+
+        if not self._sent_box:
+            self._sent_box = self._detect_sent_box(m)
+        if not self._sent_box:
+            log.warning("IMAP append skipped: can't detect Sent folder (%d messages)", len(batch))
             return
 
-        # 2) Пытаемся положить письмо
-        raw_bytes = msg_obj.as_bytes()
-        flags = r"(\Seen)"
-        resp = m.append(sent_box, flags, None, raw_bytes)
+        pending = self._append_batch(m, self._sent_box, batch)
+        if len(pending) < len(batch):
+            # папка рабочая; что не записалось — ошибка конкретных писем, в другие папки не дублируем
+            log.info("IMAP append: saved %d copies to '%s'", len(batch) - len(pending), self._sent_box)
+            if pending:
+                log.warning("IMAP append: %d copies not saved to '%s'", len(pending), self._sent_box)
+            return
 
-        # 3) Если не получилось — пробуем популярные кандидаты
-        if not resp or resp[0] != "OK":
-            log.warning("IMAP append returned non-OK for '%s': %s", sent_box, resp)
-            for cand in ["INBOX.Sent", "Sent", "Sent Items", "Отправленные", "[Gmail]/Sent Mail"]:
-                if cand == sent_box:
-                    continue
-                try:
-                    sel = m.select(f'"{cand}"')
-                    if sel and sel[0] == "OK":
-                        resp2 = m.append(cand, flags, None, raw_bytes)
-                        if resp2 and resp2[0] == "OK":
-                            sent_box = cand
-                            resp = resp2
-                            break
-                except Exception:
+        # папка из кэша не приняла ни одного письма — пробуем популярные кандидаты и запоминаем рабочую
+        log.warning("IMAP append returned non-OK for '%s'", self._sent_box)
+        for cand in _SENT_CANDIDATES:
+            if cand == self._sent_box:
+                continue
+            try:
+                m = self._connection()  # _append_batch мог переподключиться
+                sel = m.select(f'"{cand}"')
+                if not sel or sel[0] != "OK":
                     continue
+                left = self._append_batch(m, cand, pending)
+            except Exception:
+                continue
+            if len(left) < len(pending):
+                self._sent_box = cand
+                log.info("IMAP append: saved %d copies to '%s'", len(pending) - len(left), cand)
+                if left:
+                    log.warning("IMAP append: %d copies not saved to '%s'", len(left), cand)
+                return
+        log.warning("IMAP append failed for all candidates (%d messages)", len(pending))
 
-        if resp and resp[0] == "OK":
-            log.info("IMAP append: saved copy to '%s'", sent_box)
-        else:
-            log.warning("IMAP append failed for all candidates: %s", resp)
 
-        m.logout()
+imap_sent_appender = ImapSentAppender()
 
-    except Exception as e:
-        log.warning("IMAP append failed: %s", e)
+
+def _append_to_imap_sent(msg_obj) -> None:
+    """Ставит копию письма в очередь на запись в IMAP «Отправленные», если заданы IMAP_*."""
+    if not imap_sent_appender.configured():
+        log.info("IMAP append skipped: IMAP creds not configured")
+        return
+    imap_sent_appender.enqueue(msg_obj.as_bytes())
+
+
+# ===== пул SMTP-соединений =====
+
+class SMTPSession:
+    """
+    Одно долгоживущее SMTP-соединение: TLS и LOGIN делаются один раз,
+    дальше письма идут по тому же соединению.
+    """
+
+    def __init__(self) -> None:
+        self._server: Optional[smtplib.SMTP] = None
+        self._sent_on_conn = 0
+        self._last_used = 0.0
+
+    def _connect(self) -> None:
+        self.close()
+        port = int(settings.SMTP_PORT)
+        if port == 465:
+            server = smtplib.SMTP_SSL(settings.SMTP_HOST, port, timeout=30)
+        else:
+            server = smtplib.SMTP(settings.SMTP_HOST, port, timeout=30)
+            server.starttls()
+        server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        self._server = server
+        self._sent_on_conn = 0
+        self._last_used = time.monotonic()
+        log.info("SMTP: connected to %s:%s", settings.SMTP_HOST, port)
+
+    def _ensure_ready(self) -> None:
+        if self._server is None:
+            self._connect()
+            return
+        if self._sent_on_conn >= max(1, int(settings.SMTP_MAX_MESSAGES_PER_CONNECTION)):
+            self._connect()
+            return
+        # после простоя проверяем, что сервер ещё нас держит
+        if time.monotonic() - self._last_used >= int(settings.SMTP_NOOP_AFTER_IDLE):
+            try:
+                code, _ = self._server.noop()
+            except smtplib.SMTPException:
+                code = -1
+            except OSError:
+                code = -1
+            if code != 250:
+                self._connect()
+
+    def sendmail(self, from_addr: str, recipients: List[str], msg: str) -> None:
+        """
+        Отправляет письмо; при разрыве или 421 переподключается и пробует ещё раз.
+        """
+        self._ensure_ready()
+        try:
+            self._server.sendmail(from_addr, recipients, msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            log.warning("SMTP: connection lost (%s), reconnecting", e)
+            self._connect()
+            self._server.sendmail(from_addr, recipients, msg)
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code != 421:
+                raise
+            log.warning("SMTP: 421 from server (%s), reconnecting", e.smtp_error)
+            self._connect()
+            self._server.sendmail(from_addr, recipients, msg)
+        self._sent_on_conn += 1
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+
+class SMTPPool:
+    """
+    Небольшой пул SMTP-сессий. Сессию берут на одно письмо и сразу возвращают:
+    соединение остаётся открытым в пуле, а несколько рассылок (/send по разным
+    штатам) делят слоты по очереди, не забирая их себе на всю пачку.
+    """
+
+    def __init__(self, size: Optional[int] = None) -> None:
+        self._size = max(1, int(size or settings.SMTP_POOL_SIZE))
+        self._idle: "queue.LifoQueue[SMTPSession]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self._size)
+
+    @contextmanager
+    def session(self, cancelled: Optional[Callable[[], bool]] = None) -> Iterator[Optional[SMTPSession]]:
+        """
+        Сессия из пула. Пока ждём свободный слот, раз в секунду проверяем cancelled():
+        отменённая рассылка получает None и не висит в очереди за чужими письмами.
+        """
+        while not self._slots.acquire(timeout=1.0):
+            if cancelled and cancelled():
+                yield None
+                return
+        try:
+            sess = self._idle.get_nowait()
+        except queue.Empty:
+            sess = SMTPSession()
+        try:
+            yield sess
+        finally:
+            self._idle.put(sess)
+            self._slots.release()
+
+    def close_all(self) -> None:
+        """
+        Закрывает простаивающие соединения (при остановке приложения).
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+smtp_pool = SMTPPool()
 
 
 def send_email(
@@ -311,8 +614,13 @@ def send_email(
     clinic_name: str,
     clinic_site: Optional[str],
     tags: Optional[List[str]] = None,
-    custom: Optional[dict] = None
+    custom: Optional[dict] = None,
+    smtp: Optional[SMTPSession] = None,
 ) -> bool:
+    """
+    smtp — уже взятая из пула сессия (run_send берёт её на каждое письмо,
+    чтобы дождаться слота с проверкой отмены); без неё берём сессию из smtp_pool сами.
+    """
     subject = "Quick audit: a few easy wins for your dental website 🦷"
 
     html_body = build_email_html(clinic_name, clinic_site, subject)
@@ -347,15 +655,11 @@ def send_email(
         pass
 
     try:
-        port = int(settings.SMTP_PORT)
-        if port == 465:
-            server = smtplib.SMTP_SSL(settings.SMTP_HOST, port)
+        if smtp is not None:
+            smtp.sendmail(settings.SMTP_FROM, recipients, msg.as_string())
         else:
-            server = smtplib.SMTP(settings.SMTP_HOST, port)
-            server.starttls()
-        server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-        server.sendmail(settings.SMTP_FROM, recipients, msg.as_string())
-        server.quit()
+            with smtp_pool.session() as sess:
+                sess.sendmail(settings.SMTP_FROM, recipients, msg.as_string())
 
         log.info("Email successfully sent to %s", to_email)
 
@@ -5,10 +5,11 @@ from typing import Any, Dict
 
 import requests
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 
 from config import settings
-from telegram_bot import handle_update  # только обработчик
-from telegram_poller import start_polling  # только запуск поллера
+from telegram_poller import dispatcher, start_polling  # запуск поллера и очередь апдейтов
+from mailer import imap_sent_appender, smtp_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("app")
@@ -37,6 +38,8 @@ def _set_telegram_commands() -> None:
             {"command": "send", "description": "Отправить письма"},
             {"command": "stats", "description": "Статистика по штату"},
             {"command": "replies", "description": "Разобрать входящие ответы"},
+            {"command": "jobs", "description": "Фоновые задачи и прогресс"},
+            {"command": "cancel", "description": "Остановить задачу: /cancel 3"},
             {"command": "id", "description": "Показать мой chat id"},
         ]
     }
@@ -49,9 +52,9 @@ def _set_telegram_commands() -> None:
 
 
 @app.on_event("startup")
-def on_startup() -> None:
-    # 1. зарегали команды
-    _set_telegram_commands()
+async def on_startup() -> None:
+    # 1. зарегали команды (requests — блокирующий, поэтому в пуле потоков)
+    await run_in_threadpool(_set_telegram_commands)
 
     # 2. запустили long-polling всегда
     def _run_poller() -> None:
@@ -65,6 +68,13 @@ def on_startup() -> None:
     logger.info("poller thread started")
 
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    # недописанные копии писем в IMAP «Отправленные», потом закрываем SMTP-соединения
+    await run_in_threadpool(imap_sent_appender.flush)
+    await run_in_threadpool(smtp_pool.close_all)
+
+
 @app.get("/")
 def root() -> Dict[str, Any]:
     return {"ok": True, "service": "lead-generator"}
@@ -83,7 +93,8 @@ async def tg_webhook(req: Request) -> Dict[str, Any]:
     """
     data: Dict[str, Any] = await req.json()
     try:
-        return handle_update(data)
+        # как и в поллере: отвечаем телеге сразу, команда выполнится в своей очереди
+        dispatcher.submit(data)
     except Exception as e:
         logger.exception("webhook handler error: %s", e)
-        return {"ok": True}
+    return {"ok": True}
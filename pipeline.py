@@ -0,0 +1,115 @@
+# pipeline.py
+import queue
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Iterable, List, Optional
+
+from ratelimit import RateLimiter
+
+log = logging.getLogger("pipeline")
+
+_STOP = object()
+
+
+class Stage:
+    """
+    Шаг конвейера: workers потоков берут элементы из своей очереди,
+    вызывают fn(item, ctx) и отдают результат (iterable или None) следующему шагу.
+    rate — не больше rate вызовов fn в секунду на весь шаг.
+    context — фабрика контекст-менеджера на поток (например, SMTP-сессия из пула);
+    то, что он отдаёт, приходит в fn вторым аргументом.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any, Any], Optional[Iterable[Any]]],
+        workers: int = 1,
+        rate: float = 0.0,
+        context: Optional[Callable[[], ContextManager[Any]]] = None,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+        queue_size: int = 100,
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.limiter = RateLimiter(rate) if rate and rate > 0 else None
+        self.context = context or nullcontext
+        self.on_error = on_error
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+
+
+class Pipeline:
+    """
+    Цепочка Stage, связанных ограниченными очередями.
+    Медленный шаг не тормозит остальные, пока в очереди перед ним есть место.
+    """
+
+    def __init__(self, stages: List[Stage]) -> None:
+        if not stages:
+            raise ValueError("pipeline needs at least one stage")
+        self.stages = stages
+
+    def _worker(self, idx: int, done: threading.Barrier) -> None:
+        stage = self.stages[idx]
+        nxt = self.stages[idx + 1] if idx + 1 < len(self.stages) else None
+        try:
+            with stage.context() as ctx:
+                while True:
+                    item = stage.queue.get()
+                    if item is _STOP:
+                        break
+                    if stage.limiter:
+                        stage.limiter.acquire()
+                    try:
+                        out = stage.fn(item, ctx)
+                    except Exception as e:
+                        log.error("pipeline:%s failed: %s", stage.name, e)
+                        if stage.on_error:
+                            stage.on_error(item, e)
+                        continue
+                    if out is not None and nxt is not None:
+                        for o in out:
+                            nxt.queue.put(o)
+        except Exception as e:
+            # упал сам контекст (например, не смогли взять сессию) — очередь не бросаем
+            log.error("pipeline:%s worker crashed: %s", stage.name, e)
+            while True:
+                item = stage.queue.get()
+                if item is _STOP:
+                    break
+                if stage.on_error:
+                    stage.on_error(item, e)
+        finally:
+            # последний вышедший поток шага закрывает следующий шаг
+            if done.wait() == 0 and nxt is not None:
+                for _ in range(nxt.workers):
+                    nxt.queue.put(_STOP)
+
+    def run(self, source: Iterable[Any]) -> None:
+        """
+        Прогоняет все элементы source через шаги и ждёт, пока всё обработается.
+        """
+        threads: List[threading.Thread] = []
+        for idx, stage in enumerate(self.stages):
+            done = threading.Barrier(stage.workers)
+            for n in range(stage.workers):
+                th = threading.Thread(
+                    target=self._worker,
+                    args=(idx, done),
+                    name=f"pipe-{stage.name}-{n}",
+                    daemon=True,
+                )
+                th.start()
+                threads.append(th)
+
+        first = self.stages[0]
+        try:
+            for item in source:
+                first.queue.put(item)
+        finally:
+            for _ in range(first.workers):
+                first.queue.put(_STOP)
+            for th in threads:
+                th.join()
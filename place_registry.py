@@ -0,0 +1,64 @@
+# place_registry.py
+import os
+import time
+import threading
+from typing import Dict, Iterable, Optional
+
+from storage import db_path, open_sqlite
+
+PLACE_REGISTRY_PATH = os.getenv("PLACE_REGISTRY_PATH", "") or db_path("place_registry.sqlite3")
+
+
+class PlaceRegistry:
+    """
+    Постоянный реестр place_id -> (штат, список, задача) по всем прошлым сборам.
+    Место из реестра уже лежит в ClickUp — повторно его не трогаем,
+    даже если оно пришло из запроса по соседнему штату.
+    """
+
+    def __init__(self, path: str = PLACE_REGISTRY_PATH) -> None:
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS places (
+                    place_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    list_id TEXT NOT NULL DEFAULT '',
+                    task_id TEXT NOT NULL DEFAULT '',
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def get_many(self, place_ids: Iterable[str]) -> Dict[str, Dict[str, str]]:
+        keys = [p for p in place_ids if p]
+        out: Dict[str, Dict[str, str]] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT place_id, state, list_id, task_id FROM places WHERE place_id IN ({marks})",
+                    part,
+                ).fetchall()
+                for row in rows:
+                    out[row["place_id"]] = dict(row)
+        return out
+
+    def get(self, place_id: str) -> Optional[Dict[str, str]]:
+        return self.get_many([place_id]).get(place_id)
+
+    def put(self, place_id: str, state: str, list_id: str = "", task_id: str = "") -> None:
+        if not place_id:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?)",
+                (place_id, state.upper(), list_id or "", task_id or "", time.time()),
+            )
+
+    def forget(self, place_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM places WHERE place_id = ?", (place_id,))
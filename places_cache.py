@@ -0,0 +1,65 @@
+# places_cache.py
+import json
+import time
+import zlib
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from storage import open_sqlite
+
+
+class PlacesCache:
+    """
+    Кэш ответов searchText на диске (sqlite).
+    Ключ — хэш от запроса, маски полей, области и числа страниц;
+    значение — сжатый JSON со всеми местами запроса.
+    Протухшие ответы чистим при открытии, чтобы база не росла бесконечно.
+    """
+
+    def __init__(self, path: str, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    stored_at REAL NOT NULL
+                )
+                """
+            )
+        self.purge_expired()
+
+    @staticmethod
+    def key(**parts: Any) -> str:
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if not row or row["stored_at"] + self.ttl <= time.time():
+            return None
+        try:
+            return json.loads(zlib.decompress(row["body"]).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        body = zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, body, time.time())
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM responses WHERE stored_at + ? <= ?", (self.ttl, time.time())
+            )
+            return cur.rowcount
@@ -0,0 +1,172 @@
+# ratelimit.py
+import time
+import random
+import threading
+from typing import Any, Dict, Optional
+
+
+class RateLimiter:
+    """
+    Token bucket: в среднем rate операций в секунду, всплеск до burst.
+    rate <= 0 — без ограничений.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Забирает токены (в долг, если надо) и возвращает, сколько секунд нужно подождать.
+        Удобно, когда ждать надо не через time.sleep (например, в asyncio).
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Внешний сигнал "подожди" (например, 429 retry_after): обнуляем бакет на seconds.
+        """
+        if self.rate <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class RateGovernor:
+    """
+    Темп по бюджету, который сообщает сам сервер (X-RateLimit-Remaining / Reset).
+    Пока в окне больше low_water запросов (сверх reserve про запас) — пропускаем сразу;
+    ниже — остаток равномерно раскладываем до сброса окна, кончился — ждём сброса.
+    На 429 — все ждут сброса окна (или Retry-After/бэкофф с джиттером).
+    Сам не спит: delay() говорит, сколько ждать, — годится и для потоков, и для asyncio.
+    """
+
+    def __init__(
+        self,
+        reserve: int = 2,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        low_water: int = 10,
+    ) -> None:
+        self.reserve = max(0, int(reserve))
+        self.low_water = max(0, int(low_water))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self._limit: Optional[int] = None
+        self._remaining: Optional[int] = None
+        self._reset_at = 0.0
+        self._next_at = 0.0
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _header(headers: Any, name: str) -> Optional[float]:
+        try:
+            value = headers.get(name)
+            return float(value) if value not in (None, "") else None
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    def update(self, headers: Any) -> None:
+        """
+        Запоминает бюджет из заголовков ответа.
+        """
+        remaining = self._header(headers, "X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        limit = self._header(headers, "X-RateLimit-Limit")
+        reset = self._header(headers, "X-RateLimit-Reset")
+        now = time.time()
+        with self._lock:
+            self._remaining = int(remaining)
+            if limit is not None:
+                self._limit = int(limit)
+            if reset is not None:
+                # обычно unix-время сброса; маленькое число — "через столько секунд"
+                self._reset_at = reset if reset > 1e9 else now + reset
+
+    def delay(self) -> float:
+        """
+        Занимает слот под следующий запрос и возвращает, сколько секунд подождать перед ним.
+        """
+        now = time.time()
+        with self._lock:
+            start = max(now, self._blocked_until)
+            if self._remaining is None or self._reset_at <= start:
+                # бюджет неизвестен или окно уже сбросилось — идём сразу
+                return start - now
+            usable = self._remaining - self.reserve
+            if usable <= 0:
+                # бюджет кончился — до сброса окна ждут все, а не только первый
+                self._blocked_until = max(self._blocked_until, self._reset_at)
+                self._remaining = 0
+                return max(start, self._reset_at) - now
+            self._remaining -= 1
+            if usable > self.low_water:
+                # запас большой — не тормозим (параллельные писатели идут разом)
+                return start - now
+            # запас на исходе — растягиваем остаток до сброса окна
+            start = max(start, self._next_at)
+            self._next_at = start + (self._reset_at - start) / usable
+            return start - now
+
+    def throttled(self, headers: Any, attempt: int) -> float:
+        """
+        Ответ 429: ставим на паузу всех до сброса окна / retry_after
+        (не меньше бэкоффа с джиттером) и говорим, сколько это.
+        """
+        self.update(headers)
+        now = time.time()
+        wait = self.backoff(attempt)
+        retry_after = self._header(headers, "Retry-After")
+        if retry_after is not None:
+            wait = max(wait, retry_after)
+        with self._lock:
+            if self._reset_at > now:
+                wait = max(wait, self._reset_at - now)
+            self._blocked_until = max(self._blocked_until, now + wait)
+            return self._blocked_until - now
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Экспоненциальная пауза перед повтором attempt (0, 1, ...) с "полным" джиттером.
+        """
+        cap = min(self.backoff_max, self.backoff_base * (2 ** max(0, attempt)))
+        return random.uniform(cap / 2, cap)
+
+    def budget(self) -> Dict[str, Any]:
+        """
+        Текущий бюджет: сколько запросов осталось, когда сброс и с какой скоростью
+        можно идти до него (rate_per_sec) — чтобы пачки подбирали себе темп.
+        """
+        now = time.time()
+        with self._lock:
+            reset_in = max(0.0, self._reset_at - now)
+            usable = None if self._remaining is None else max(0, self._remaining - self.reserve)
+            return {
+                "limit": self._limit,
+                "remaining": self._remaining,
+                "reset_in": round(reset_in, 1),
+                "blocked_for": round(max(0.0, self._blocked_until - now), 1),
+                "rate_per_sec": round(usable / reset_in, 2) if usable is not None and reset_in > 0 else None,
+            }
@@ -1,11 +1,12 @@
 # send.py
 import re
-import time
 import logging
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, Callable, Iterator, List, Optional
 
 from fastapi import APIRouter, HTTPException
 
+from config import settings
 from clickup_client import (
     clickup_client,
     READY_STATUS,
@@ -13,9 +14,10 @@ from clickup_client import (
     INVALID_STATUS,
     NEW_STATUS,
 )
-from mailer import send_email
-from email_validator import validate_email_if_needed
-from utils import _task_status_str
+from mailer import imap_sent_appender, send_email, smtp_pool
+from email_validator import validate_emails_batch
+from pipeline import Pipeline, Stage
+from utils import _task_status_str, _task_description
 
 log = logging.getLogger("sender")
 router = APIRouter()
@@ -54,104 +56,238 @@ def _parse_details(description: str) -> Dict[str, str]:
     return {"email": email, "website": website}
 
 
-def run_send(state: str, limit: int = 50) -> Dict[str, Any]:
+def _ready_leads(list_id: str) -> Iterator[Dict[str, Any]]:
+    """
+    READY-задачи листа потоком, сразу с описаниями — без GET /task на каждую.
+    Следующая страница грузится в фоне, пока обрабатываем текущую.
+    """
+    for t in clickup_client.iter_leads(
+        list_id,
+        statuses=[READY_STATUS],
+        include_description=True,
+        fields=("id", "name", "status", "markdown_description", "description"),
+        prefetch=True,
+    ):
+        if _task_status_str(t).upper() == READY_STATUS:
+            yield t
+
+
+def run_send(
+    state: str,
+    limit: int = 50,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    Рассылка по READY-задачам штата (не больше limit).
+    progress(счётчики) зовём при каждом изменении счётчиков; после cancelled() == True
+    новые письма не уходят, неотправленные задачи остаются в READY.
+    """
     try:
         list_id = clickup_client.get_or_create_list_for_state(state)
-        all_tasks = clickup_client.get_leads_from_list(list_id)
     except Exception as e:
-        log.error("run_send: ClickUp error on get_leads_from_list: %s", e)
+        log.error("run_send: ClickUp error on get_or_create_list_for_state: %s", e)
         raise RuntimeError(f"ClickUp error: {e}")
 
-    # готовые к отправке
-    ready_tasks = [t for t in all_tasks if _task_status_str(t).upper() == READY_STATUS]
+    limit = max(0, int(limit))
+    taken = 0
 
-    tasks_to_process = ready_tasks[: max(0, int(limit))]
-    log.info(
-        "run_send for %s: Total=%d, Ready=%d, Processing=%d",
-        state,
-        len(all_tasks),
-        len(ready_tasks),
-        len(tasks_to_process),
-    )
+    counts = {"sent": 0, "skipped_no_email": 0, "failed_send": 0, "invalid": 0, "failed_mark": 0}
+    counts_lock = threading.Lock()
+    # сколько задач за прогон реально ушло из READY (в INVALID/SENT) — для остатка как в старом отчёте
+    moved_out = 0
 
-    sent = 0
-    skipped_no_email = 0
-    failed_send = 0
-    invalid_count = 0
+    def _moved_out() -> None:
+        nonlocal moved_out
+        with counts_lock:
+            moved_out += 1
 
-    for lead_stub in tasks_to_process:
-        task_id = lead_stub.get("id")
-        clinic_name = lead_stub.get("name")
-        if not task_id or not clinic_name:
-            continue
+    def _bump(key: str) -> None:
+        with counts_lock:
+            counts[key] += 1
+            snapshot = dict(counts)
+        if progress:
+            progress(snapshot)
 
-        try:
-            task_details = clickup_client.get_task_details(task_id)
-            description = task_details.get("description", "")
-
-            parsed = _parse_details(description)
-            email = parsed.get("email")
-            website = parsed.get("website")
-
-            if not email:
-                log.warning(
-                    "Task %s (%s) is READY but has no 'Email:' in description.",
-                    task_id,
-                    clinic_name,
-                )
-                skipped_no_email += 1
-                continue
-
-            # Валидация e-mail (если включена)
-            log.info("Validating email %s for %s", email, clinic_name)
-            is_valid = validate_email_if_needed(email)
-            if is_valid is False:
-                log.warning("Email %s for %s is INVALID.", email, clinic_name)
-                clickup_client.move_lead_to_status(task_id, INVALID_STATUS)
-                invalid_count += 1
-                continue
-
-            # Теги/кастом для аналитики Brevo
-            brevo_tags = ["proposals", state.lower()]
-            brevo_custom = {
-                "task_id": task_id,
-                "clinic_name": clinic_name,
-                "state": state,
-                "list_id": list_id,
-                "website": website or "",
-            }
-
-            log.info(
-                "Sending email to %s for %s (tags=%s custom=%s)",
-                email,
+    def _stopped() -> bool:
+        return bool(cancelled and cancelled())
+
+    def _source() -> Iterator[Dict[str, Any]]:
+        # Дальше лимита не листаем: задачи уходят из READY, и страницы сдвигаются,
+        # поэтому остаток READY считаем отдельным запросом в конце.
+        nonlocal taken
+        for lead_stub in _ready_leads(list_id):
+            if taken >= limit or _stopped():
+                break
+            taken += 1
+            if lead_stub.get("id") and lead_stub.get("name"):
+                yield lead_stub
+
+    def _to_job(lead_stub: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        task_id = lead_stub["id"]
+        clinic_name = lead_stub["name"]
+
+        if "markdown_description" in lead_stub or "description" in lead_stub:
+            description = _task_description(lead_stub)
+        else:
+            # на всякий случай: листинг пришёл без описаний
+            description = _task_description(clickup_client.get_task_details(task_id))
+
+        parsed = _parse_details(description)
+        email = parsed.get("email")
+        if not email:
+            log.warning(
+                "Task %s (%s) is READY but has no 'Email:' in description.",
+                task_id,
                 clinic_name,
-                brevo_tags,
-                brevo_custom,
             )
+            _bump("skipped_no_email")
+            return None
+        return {"task_id": task_id, "clinic_name": clinic_name, "email": email, "website": parsed.get("website")}
 
-            ok = send_email(
-                to_email=email,
-                clinic_name=clinic_name,
-                clinic_site=website,  # может быть None — mailer обрабатывает
-                tags=brevo_tags,
-                custom=brevo_custom,
-            )
+    # --- шаг 0: собираем пачку и валидируем все адреса одной задачей провайдера ---
+    jobs: List[Dict[str, Any]] = []
+    for lead_stub in _source():
+        try:
+            job = _to_job(lead_stub)
+        except Exception as e:
+            log.error("run_send: Failed to process task %s: %s", lead_stub.get("id"), e)
+            _bump("failed_send")
+            continue
+        if job:
+            jobs.append(job)
 
-            if ok:
-                sent += 1
-                clickup_client.move_lead_to_status(task_id, SENT_STATUS)
-                # Небольшая пауза, чтобы не ловить троттлинг у SMTP-провайдера
-                time.sleep(0.4)
-            else:
-                failed_send += 1
+    log.info("Validating %d emails for %s", len(jobs), state)
+    verdicts = validate_emails_batch(j["email"] for j in jobs)
 
-        except Exception as e:
-            log.error("run_send: Failed to process task %s: %s", task_id, e)
-            failed_send += 1
+    # --- шаг 1: невалидные -> INVALID, остальные дальше ---
+    def _check(job: Dict[str, Any], _ctx: Any) -> Optional[List[Dict[str, Any]]]:
+        if _stopped():
+            return None
+        if verdicts.get(job["email"].lower(), True) is False:
+            log.warning("Email %s for %s is INVALID.", job["email"], job["clinic_name"])
+            if clickup_client.move_lead_to_status(job["task_id"], INVALID_STATUS):
+                _moved_out()
+            _bump("invalid")
+            return None
+        return [job]
+
+    # --- шаг 2: SMTP (сессия из пула на каждое письмо — соединения в пуле живут дальше) ---
+    def _send(job: Dict[str, Any], _ctx: Any) -> Optional[List[Dict[str, Any]]]:
+        if _stopped():
+            return None
+        with smtp_pool.session(cancelled=_stopped) as smtp:
+            if smtp is None:
+                return None
+            return _send_with(job, smtp)
+
+    def _send_with(job: Dict[str, Any], smtp: Any) -> Optional[List[Dict[str, Any]]]:
+        # Теги/кастом для аналитики Brevo
+        brevo_tags = ["proposals", state.lower()]
+        brevo_custom = {
+            "task_id": job["task_id"],
+            "clinic_name": job["clinic_name"],
+            "state": state,
+            "list_id": list_id,
+            "website": job["website"] or "",
+        }
+
+        log.info(
+            "Sending email to %s for %s (tags=%s custom=%s)",
+            job["email"],
+            job["clinic_name"],
+            brevo_tags,
+            brevo_custom,
+        )
+
+        ok = send_email(
+            to_email=job["email"],
+            clinic_name=job["clinic_name"],
+            clinic_site=job["website"],  # может быть None — mailer обрабатывает
+            tags=brevo_tags,
+            custom=brevo_custom,
+            smtp=smtp,
+        )
+        if not ok:
+            _bump("failed_send")
+            return None
+        _bump("sent")
+        return [job]
+
+    # --- шаг 3: статус в ClickUp ---
+    def _mark(job: Dict[str, Any], _ctx: Any) -> None:
+        # update_task_status не бросает, а возвращает False
+        if clickup_client.move_lead_to_status(job["task_id"], SENT_STATUS):
+            _moved_out()
+        else:
+            log.error("run_send: Failed to mark task %s as %s", job["task_id"], SENT_STATUS)
+            _bump("failed_mark")
+        return None
+
+    def _failed(item: Dict[str, Any], e: Exception) -> None:
+        log.error("run_send: Failed to process task %s: %s", item.get("task_id") or item.get("id"), e)
+        _bump("failed_send")
+
+    def _failed_mark(item: Dict[str, Any], e: Exception) -> None:
+        # письмо уже ушло (посчитано в sent), не удалось только перевести задачу в SENT
+        log.error("run_send: Failed to mark task %s as %s: %s", item.get("task_id"), SENT_STATUS, e)
+        _bump("failed_mark")
+
+    smtp_workers = int(settings.SEND_SMTP_WORKERS) or int(settings.SMTP_POOL_SIZE)
+    Pipeline([
+        Stage(
+            "check",
+            _check,
+            workers=settings.SEND_CLICKUP_WORKERS,
+            on_error=_failed,
+        ),
+        Stage(
+            "smtp",
+            _send,
+            workers=smtp_workers,
+            # вместо паузы 0.4 сек после каждого письма — общий лимит на шаг
+            rate=settings.SEND_RATE_PER_SEC,
+            on_error=_failed,
+        ),
+        Stage(
+            "clickup",
+            _mark,
+            workers=settings.SEND_CLICKUP_WORKERS,
+            on_error=_failed_mark,
+        ),
+    ]).run(jobs)
 
+    # копии в «Отправленные» пишутся в фоне — дожидаемся их до отчёта
+    if not imap_sent_appender.flush():
+        log.warning("run_send: IMAP Sent queue not drained in time")
+
+    sent = counts["sent"]
+    skipped_no_email = counts["skipped_no_email"]
+    failed_send = counts["failed_send"]
+    invalid_count = counts["invalid"]
+
+    try:
+        # один проход по листу (только id и статус) на все счётчики отчёта
+        tasks = clickup_client.get_leads_from_list(list_id, fields=("id", "status"))
+    except Exception as e:
+        log.error("run_send: ClickUp error on list counters: %s", e)
+        raise RuntimeError(f"ClickUp error: {e}")
+    statuses = [_task_status_str(t).upper() for t in tasks]
+    ready_left = statuses.count(READY_STATUS)
+    new_count = statuses.count(NEW_STATUS)
+    total_in_list = len(tasks)
+
+    # как раньше: READY на начало прогона минус всё обработанное (в т.ч. ошибки и без email).
+    # READY на начало = свежий READY + ушедшие из него за прогон.
     processed_count = sent + invalid_count + failed_send + skipped_no_email
-    remaining_ready = max(0, len(ready_tasks) - processed_count)
-    new_count = sum(1 for t in all_tasks if _task_status_str(t).upper() == NEW_STATUS)
+    remaining_ready = max(0, ready_left + moved_out - processed_count)
+    log.info(
+        "run_send for %s: Total=%d, Processed=%d, Ready left=%d",
+        state,
+        total_in_list,
+        taken,
+        remaining_ready,
+    )
 
     return {
         "state": state,
@@ -161,7 +297,7 @@ def run_send(state: str, limit: int = 50) -> Dict[str, Any]:
         "failed_send": failed_send,
         "remaining_ready": remaining_ready,
         "total_new": new_count,
-        "total_in_list": len(all_tasks),
+        "total_in_list": total_in_list,
     }
 
 
@@ -0,0 +1,27 @@
+# storage.py
+import os
+import sqlite3
+
+# куда складываем локальные sqlite-базы (индексы, кэши)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+
+def db_path(filename: str) -> str:
+    return os.path.join(DATA_DIR, filename)
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Открывает sqlite-базу для использования из нескольких потоков.
+    Сериализация доступа — на стороне вызывающего (через свой lock).
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.DatabaseError:
+        pass
+    return conn
@@ -14,6 +14,7 @@ from clickup_client import (
     INVALID_STATUS
 )
 from telegram_notifier import send_message as tg_send
+from jobs import Job, job_manager
 from send import run_send
 from leads import upsert_leads_for_state
 from utils import _task_status_str  # <-- 🟢 ВОТ ИСПРАВЛЕНИЕ 🟢
@@ -31,6 +32,10 @@ US_STATES = [
 
 USER_STATE: Dict[int, str] = {}
 
+# команды, которые не читают и не пишут состояние чата (USER_STATE) — их можно
+# обработать вне очереди чата, порядок с /collect и выбором штата они не ломают
+QUICK_COMMANDS = {"/jobs", "/cancel"}
+
 
 def _allowed_chat(chat_id: int) -> bool:
     want = str(getattr(settings, "TELEGRAM_CHAT_ID", "")).strip()
@@ -55,13 +60,28 @@ def _parse_cmd(text: str) -> List[str]:
     return [p.strip() for p in parts if p.strip()]
 
 
+def is_quick_update(update: Dict[str, Any]) -> bool:
+    """
+    Быстрый ли апдейт: команда из QUICK_COMMANDS. Всё остальное (выбор штата,
+    обычный текст, пустые апдейты) идёт по порядку через очередь своего чата.
+    """
+    msg = update.get("message") or update.get("edited_message") or {}
+    text = (msg.get("text") or "").strip()
+    if not text.startswith("/"):
+        return False
+    parts = _parse_cmd(text)
+    # /stats@my_bot тоже считается
+    return parts[0].lower().split("@", 1)[0] in QUICK_COMMANDS
+
+
 # 🟢 ФУНКЦИЯ _task_status_str УДАЛЕНА ОТСЮДА (она теперь в utils.py) 🟢
 
 
 def _stats_for_state(state: str) -> str:
     try:
         list_id = clickup_client.get_or_create_list_for_state(state)
-        tasks = clickup_client.get_leads_from_list(list_id)
+        # для статистики нужны только статусы — остальное не держим
+        tasks = clickup_client.get_leads_from_list(list_id, fields=("id", "status"))
     except Exception as e:
         log.error("Failed to get stats for %s: %s", state, e)
         return f"Ошибка получения статистики для {state}: {e}"
@@ -102,48 +122,74 @@ def _stats_for_state(state: str) -> str:
     )
 
 
-def _handle_collect(chat_id: int, state: str) -> None:
-    tg_send(chat_id, f"Начинаю сбор для {state}... (Google ищет)")
-    try:
+def _handle_collect(chat_id: int, state: str, force_refresh: bool = False) -> None:
+    suffix = ", без кэша" if force_refresh else ""
+
+    def _run(job: Job) -> str:
         # собираем
-        report = upsert_leads_for_state(state)
-        
+        report = upsert_leads_for_state(
+            state,
+            force_refresh=force_refresh,
+            progress=job.progress,
+            cancelled=job.cancelled,
+        )
+
         # после сбора ещё раз считаем по факту
         stats = _stats_for_state(state)
 
-        text = (
-            f"<b>Сбор завершён: {state}</b>\n"
+        title = "Сбор остановлен" if job.cancelled() else "Сбор завершён"
+        return (
+            f"<b>{title}: {state}</b>\n"
             f"Найдено: {report['found']}\n"
             f"Создано новых: {report['created']}\n"
             f"Пропущено (дубликаты): {report['skipped']}\n\n"
             f"{stats}"
         )
-        tg_send(chat_id, text, parse_mode="HTML")
-    except Exception as e:
-        log.error("Handle_collect error: %s", e)
-        tg_send(chat_id, f"Ошибка при сборе {state}: {e}")
+
+    job_manager.start(
+        chat_id,
+        f"Сбор {state}{suffix}",
+        _run,
+        labels={"found": "Найдено", "created": "Создано новых", "skipped": "Пропущено (дубликаты)"},
+        rate_key="created",
+    )
 
 
 def _handle_send(chat_id: int, state: str, limit: int) -> None:
-    tg_send(chat_id, f"Начинаю рассылку для {state} (лимит: {limit})...")
-    try:
-        report = run_send(state=state, limit=limit)
-        text = (
-            f"<b>Рассылка {state} (лимит {limit})</b>\n"
+    def _run(job: Job) -> str:
+        report = run_send(state=state, limit=limit, progress=job.progress, cancelled=job.cancelled)
+        title = f"Рассылка {state} (лимит {limit})"
+        if job.cancelled():
+            title += " — остановлена"
+        # в отчёт run_send не входит — берём из счётчиков прогресса
+        not_marked = job.counters.get("failed_mark", 0)
+        return (
+            f"<b>{title}</b>\n"
             f"---\n"
             f"✅ Отправлено: {report['sent']}\n"
             f"❌ Невалидных (-> INVALID): {report['invalid']}\n"
             f"🚫 Ошибок отправки (SMTP): {report['failed_send']}\n"
             f"🤔 Пропущено (нет Email): {report['skipped_no_email']}\n"
-            f"---\n"
+            + (f"⚠️ Не переведено в 'SENT' (ClickUp): {not_marked}\n" if not_marked else "")
+            + f"---\n"
             f"📈 Осталось в 'READY': {report['remaining_ready']}\n"
             f"📊 В подготовке 'NEW': {report['total_new']}\n"
             f"Σ Всего в листе: {report['total_in_list']}"
         )
-        tg_send(chat_id, text, parse_mode="HTML")
-    except Exception as e:
-        log.error("Handle_send error: %s", e)
-        tg_send(chat_id, f"Ошибка при рассылке {state}: {e}")
+
+    job_manager.start(
+        chat_id,
+        f"Рассылка {state} (лимит {limit})",
+        _run,
+        labels={
+            "sent": "✅ Отправлено",
+            "invalid": "❌ Невалидных",
+            "failed_send": "🚫 Ошибок отправки",
+            "failed_mark": "⚠️ Не переведено в SENT",
+            "skipped_no_email": "🤔 Нет Email",
+        },
+        rate_key="sent",
+    )
 
 
 def _imap_fetch_unseen_froms(n_last: int = 50) -> List[str]:
@@ -186,41 +232,56 @@ def _imap_fetch_unseen_froms(n_last: int = 50) -> List[str]:
 
 
 def _handle_replies(chat_id: int) -> None:
-    tg_send(chat_id, "Проверяю почту (IMAP)...")
-    try:
+    def _run(job: Job) -> str:
         from_list = _imap_fetch_unseen_froms()
         if not from_list:
-            tg_send(chat_id, "Новых ответов нет.")
-            return
+            return "Новых ответов нет."
 
         log.info("IMAP: processing replies from: %s", from_list)
         moved = 0
-        for addr in from_list:
+        for n, addr in enumerate(from_list, start=1):
+            if job.cancelled():
+                break
             task = clickup_client.find_task_by_email(addr)
             if task:
                 log.info("IMAP: Found task %s for email %s", task['task_id'], addr)
                 clickup_client.move_lead_to_status(task["task_id"], REPLIED_STATUS)
                 moved += 1
-                
+
                 # --- Логика для извлечения штата ---
                 list_name = task.get('list_name', '') # e.g., "LEADS-NY"
                 state = list_name.replace('LEADS-', '').upper() # e.g., "NY"
                 state_info = f" (Штат: {state})" if state in US_STATES else ""
                 # ---
-                
+
                 tg_send(
                     chat_id,
                     f"📩 Ответ от <b>{task['clinic_name']}</b>{state_info}.\nПеренесено в «{REPLIED_STATUS}».",
                     parse_mode="HTML",
+                    # пачка ответов придёт одним сообщением, а не по одному на каждый
+                    coalesce=True,
                 )
             else:
                 log.warning("IMAP: No task found for email %s", addr)
-                
+            job.progress({"checked": n, "moved": moved})
+
         if moved == 0:
-            tg_send(chat_id, f"Получено {len(from_list)} ответов, но не нашел для них задач в ClickUp.")
-    except Exception as e:
-        log.error("Handle_replies error: %s", e)
-        tg_send(chat_id, f"Ошибка при проверке ответов: {e}")
+            return f"Получено {len(from_list)} ответов, но не нашел для них задач в ClickUp."
+        return f"Ответов: {len(from_list)}, перенесено в «{REPLIED_STATUS}»: {moved}."
+
+    job_manager.start(
+        chat_id,
+        "Проверка ответов (IMAP)",
+        _run,
+        labels={"checked": "Проверено писем", "moved": "Перенесено"},
+    )
+
+
+def _jobs_text(chat_id: int) -> str:
+    jobs = job_manager.list(chat_id)
+    if not jobs:
+        return "Задач нет."
+    return "<b>Задачи</b>\n" + "\n".join(j.summary() for j in jobs)
 
 
 def _help_text() -> str:
@@ -228,9 +289,13 @@ def _help_text() -> str:
         "Команды:\n"
         "/menu — клавиатура штатов\n"
         "/collect NY — собрать и показать статистику\n"
+        "/collect NY refresh — то же, но заново спросить Google (мимо кэша)\n"
+        "/collect NY CA TX — несколько штатов сразу, каждый отдельной задачей\n"
         "/send NY 10 — отправить письма (limit) или /send 10 (если штат выбран)\n"
         "/stats NY — сводка по штату\n"
         "/replies — обработать входящие ответы\n"
+        "/jobs — фоновые задачи и их прогресс\n"
+        "/cancel 3 — остановить задачу #3\n"
         "/id — показать ваш chat id"
     )
 
@@ -250,6 +315,8 @@ def register_commands() -> None:
             {"command": "send",    "description": "Отправить письма"},
             {"command": "stats",   "description": "Статистика по штату"},
             {"command": "replies", "description": "Обработать входящие ответы"},
+            {"command": "jobs",    "description": "Фоновые задачи"},
+            {"command": "cancel",  "description": "Остановить задачу: /cancel 3"},
         ]
         r = requests.post(
             f"{TELEGRAM_API_BASE}/bot{token}/setMyCommands",
@@ -299,11 +366,15 @@ def handle_update(update: Dict[str, Any]) -> Dict[str, Any]:
         return {"ok": True}
 
     if cmd in ("/collect", "/search"):
-        state = (parts[1].upper() if len(parts) > 1 else USER_STATE.get(chat_id))
-        if not state or state not in US_STATES:
-            tg_send(chat_id, "Укажи штат: /collect NY или выбери через /menu")
+        args = [p for p in parts[1:] if p.lower() != "refresh"]
+        force_refresh = len(args) != len(parts) - 1
+        states = [a.upper() for a in args] or [USER_STATE.get(chat_id)]
+        if not all(s and s in US_STATES for s in states):
+            tg_send(chat_id, "Укажи штат: /collect NY (или /collect NY CA TX) или выбери через /menu")
             return {"ok": True}
-        _handle_collect(chat_id, state)
+        # каждый штат — отдельная фоновая задача, идут параллельно
+        for state in dict.fromkeys(states):
+            _handle_collect(chat_id, state, force_refresh=force_refresh)
         return {"ok": True}
 
     if cmd == "/send":
@@ -341,5 +412,22 @@ def handle_update(update: Dict[str, Any]) -> Dict[str, Any]:
         _handle_replies(chat_id)
         return {"ok": True}
 
+    if cmd == "/jobs":
+        tg_send(chat_id, _jobs_text(chat_id), parse_mode="HTML")
+        return {"ok": True}
+
+    if cmd == "/cancel":
+        try:
+            job_id = int(parts[1].lstrip("#"))
+        except (ValueError, IndexError):
+            tg_send(chat_id, "Укажи номер задачи: /cancel 3 (номера — в /jobs)")
+            return {"ok": True}
+        job = job_manager.get(job_id)
+        if not job or job.chat_id != chat_id or not job_manager.cancel(job_id):
+            tg_send(chat_id, f"Задача #{job_id} не найдена или уже завершена.")
+            return {"ok": True}
+        tg_send(chat_id, f"Останавливаю задачу #{job_id}...")
+        return {"ok": True}
+
     tg_send(chat_id, "Не понимаю команду. Напиши /help")
     return {"ok": True}
@@ -1,11 +1,148 @@
 # telegram_notifier.py
 import logging
+import threading
 import requests
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from config import settings
+from ratelimit import RateLimiter
 
 logger = logging.getLogger("app")
 TELEGRAM_API_BASE = "https://api.telegram.org"
+TELEGRAM_TEXT_LIMIT = 4096
+
+# одно keep-alive соединение на все отправки вместо нового TLS на каждое сообщение
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=10))
+
+# лимиты телеги: ~30 сообщений/сек на бота и ~1/сек в один чат (короткие всплески можно)
+_global_limiter = RateLimiter(settings.TELEGRAM_GLOBAL_RATE)
+_chat_limiters: Dict[Any, RateLimiter] = {}
+_chat_limiters_lock = threading.Lock()
+
+
+def _chat_limiter(chat_id: Any) -> RateLimiter:
+    with _chat_limiters_lock:
+        lim = _chat_limiters.get(chat_id)
+        if lim is None:
+            lim = RateLimiter(settings.TELEGRAM_CHAT_RATE, burst=settings.TELEGRAM_CHAT_BURST)
+            _chat_limiters[chat_id] = lim
+        return lim
+
+
+def _call(method: str, payload: Dict[str, Any]) -> Optional[requests.Response]:
+    """
+    POST в Bot API с учётом лимитов. На 429 ждём retry_after (и придерживаем
+    остальные отправки в этот чат) и повторяем, не больше TELEGRAM_SEND_RETRIES раз.
+    """
+    token = settings.TELEGRAM_BOT_TOKEN
+    url = f"{TELEGRAM_API_BASE}/bot{token}/{method}"
+    chat_lim = _chat_limiter(payload.get("chat_id"))
+
+    r = None
+    for _ in range(max(1, int(settings.TELEGRAM_SEND_RETRIES)) + 1):
+        chat_lim.acquire()
+        _global_limiter.acquire()
+        r = _session.post(url, json=payload, timeout=15)
+        if r.status_code != 429:
+            return r
+        try:
+            retry_after = float(r.json().get("parameters", {}).get("retry_after", 1))
+        except Exception:
+            retry_after = 1.0
+        logger.warning("[tg] %s: 429, retry after %.0fs", method, retry_after)
+        chat_lim.pause(retry_after)
+    return r
+
+
+def _send_now(
+    chat_id: int,
+    text: str,
+    parse_mode: Optional[str],
+    reply_markup: Optional[Dict[str, Any]],
+    disable_web_page_preview: bool,
+) -> Optional[int]:
+    payload: Dict[str, Any] = {
+        "chat_id": chat_id,
+        "text": text,
+        "disable_web_page_preview": disable_web_page_preview,
+    }
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+
+    r = _call("sendMessage", payload)
+    if r is None or r.status_code != 200:
+        logger.warning("[tg] sendMessage failed: %s %s", getattr(r, "status_code", None), getattr(r, "text", ""))
+        return None
+    try:
+        return r.json()["result"]["message_id"]
+    except Exception:
+        return None
+
+
+class _Coalescer:
+    """
+    Склеивает сообщения, пришедшие в один чат в течение окна, в одно
+    (например, пачка «📩 Ответ от ...» из /replies). Окно открывается первым
+    сообщением; по его окончании всё накопленное уходит одним-двумя сообщениями.
+    """
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._buf: Dict[Tuple[Any, Optional[str]], List[str]] = {}
+
+    def add(self, chat_id: int, text: str, parse_mode: Optional[str]) -> None:
+        key = (chat_id, parse_mode)
+        with self._lock:
+            buf = self._buf.get(key)
+            if buf is not None:
+                buf.append(text)
+                return
+            self._buf[key] = [text]
+        timer = threading.Timer(self.window, self._flush, args=(key,))
+        timer.daemon = True
+        timer.start()
+
+    def _flush(self, key: Tuple[Any, Optional[str]]) -> None:
+        with self._lock:
+            texts = self._buf.pop(key, None)
+        if not texts:
+            return
+        chat_id, parse_mode = key
+        for chunk in _pack(texts):
+            try:
+                _send_now(chat_id, chunk, parse_mode, None, True)
+            except Exception as e:
+                logger.warning("[tg] coalesced send failed: %s", e)
+
+    def flush(self) -> None:
+        with self._lock:
+            keys = list(self._buf)
+        for key in keys:
+            self._flush(key)
+
+
+def _pack(texts: List[str]) -> List[str]:
+    """
+    Собирает тексты в сообщения не длиннее лимита телеги (тексты не режем).
+    """
+    out: List[str] = []
+    cur = ""
+    for t in texts:
+        t = t[:TELEGRAM_TEXT_LIMIT]
+        if cur and len(cur) + 2 + len(t) > TELEGRAM_TEXT_LIMIT:
+            out.append(cur)
+            cur = ""
+        cur = f"{cur}\n\n{t}" if cur else t
+    if cur:
+        out.append(cur)
+    return out
+
+
+_coalescer = _Coalescer(settings.TELEGRAM_COALESCE_SECONDS)
+
 
 def send_message(
     chat_id: int,
@@ -13,24 +150,52 @@ def send_message(
     parse_mode: Optional[str] = "HTML",
     reply_markup: Optional[Dict[str, Any]] = None,
     disable_web_page_preview: bool = True,
-) -> None:
+    coalesce: bool = False,
+) -> Optional[int]:
     """
     Универсальная отправка сообщений в Telegram.
     Поддерживает parse_mode и reply_markup (клавиатуру).
+    Возвращает message_id (нужен, чтобы потом редактировать сообщение) или None.
+    coalesce=True — не слать сразу, а склеить с соседними сообщениями этого чата
+    за TELEGRAM_COALESCE_SECONDS (message_id тогда не возвращается).
     """
-    token = settings.TELEGRAM_BOT_TOKEN
-    url = f"{TELEGRAM_API_BASE}/bot{token}/sendMessage"
+    if coalesce and not reply_markup and settings.TELEGRAM_COALESCE_SECONDS > 0:
+        _coalescer.add(chat_id, text, parse_mode)
+        return None
+    return _send_now(chat_id, text, parse_mode, reply_markup, disable_web_page_preview)
 
+
+def flush_coalesced() -> None:
+    """
+    Отправить всё, что ждёт в окнах склейки, прямо сейчас.
+    """
+    _coalescer.flush()
+
+
+def edit_message(
+    chat_id: int,
+    message_id: int,
+    text: str,
+    parse_mode: Optional[str] = "HTML",
+    disable_web_page_preview: bool = True,
+) -> bool:
+    """
+    Меняет текст уже отправленного сообщения (прогресс долгих задач).
+    """
     payload: Dict[str, Any] = {
         "chat_id": chat_id,
+        "message_id": message_id,
         "text": text,
         "disable_web_page_preview": disable_web_page_preview,
     }
     if parse_mode:
         payload["parse_mode"] = parse_mode
-    if reply_markup:
-        payload["reply_markup"] = reply_markup
 
-    r = requests.post(url, json=payload, timeout=15)
-    if r.status_code != 200:
-        logger.warning("[tg] sendMessage failed: %s %s", r.status_code, r.text)
+    r = _call("editMessageText", payload)
+    if r is None or r.status_code != 200:
+        # тот же текст телега считает ошибкой — это не повод шуметь в логах
+        if r is not None and "message is not modified" in r.text:
+            return True
+        logger.warning("[tg] editMessageText failed: %s %s", getattr(r, "status_code", None), getattr(r, "text", ""))
+        return False
+    return True
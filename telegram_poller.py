@@ -1,7 +1,10 @@
 # telegram_poller.py
 import time
 import logging
-from typing import Dict, Any
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Any
 
 import requests
 
@@ -12,6 +15,70 @@ logger = logging.getLogger("app.poller")
 TELEGRAM_API_BASE = "https://api.telegram.org"
 
 
+class UpdateDispatcher:
+    """
+    Раздаёт апдейты по потокам, чтобы цикл getUpdates не стоял на долгих командах.
+    У каждого чата своя очередь: его апдейты выполняются строго по порядку,
+    разные чаты идут параллельно. Команды, не трогающие состояние чата (/jobs, /cancel),
+    идут отдельной полосой и не ждут, пока в чате крутится /collect или /send.
+    """
+
+    def __init__(self, chat_workers: int, fast_workers: int) -> None:
+        self._chat_pool = ThreadPoolExecutor(max_workers=max(1, chat_workers), thread_name_prefix="tg-chat")
+        self._fast_pool = ThreadPoolExecutor(max_workers=max(1, fast_workers), thread_name_prefix="tg-fast")
+        self._lock = threading.Lock()
+        self._queues: Dict[Any, Deque[Dict[str, Any]]] = {}
+
+    @staticmethod
+    def _run(upd: Dict[str, Any]) -> None:
+        # импорт тут, чтобы не ловить циклический импорт наверху
+        from telegram_bot import handle_update  # noqa
+
+        try:
+            handle_update(upd)
+        except Exception as e:
+            logger.exception("[poller] handle_update error: %s", e)
+
+    def submit(self, upd: Dict[str, Any]) -> None:
+        from telegram_bot import is_quick_update  # noqa
+
+        if is_quick_update(upd):
+            self._fast_pool.submit(self._run, upd)
+            return
+
+        chat_id = (
+            upd.get("message") or upd.get("edited_message") or {}
+        ).get("chat", {}).get("id")
+        with self._lock:
+            q = self._queues.get(chat_id)
+            if q is not None:
+                # в чате уже кто-то работает — встанет в очередь за ним
+                q.append(upd)
+                return
+            self._queues[chat_id] = deque([upd])
+        self._chat_pool.submit(self._drain, chat_id)
+
+    def _drain(self, chat_id: Any) -> None:
+        while True:
+            with self._lock:
+                q = self._queues[chat_id]
+                if not q:
+                    del self._queues[chat_id]
+                    return
+                upd = q.popleft()
+            self._run(upd)
+
+    def pending(self) -> Dict[Any, int]:
+        """
+        Сколько апдейтов ждёт в очереди каждого чата (без выполняющегося).
+        """
+        with self._lock:
+            return {chat_id: len(q) for chat_id, q in self._queues.items()}
+
+
+dispatcher = UpdateDispatcher(settings.TELEGRAM_CHAT_WORKERS, settings.TELEGRAM_FAST_WORKERS)
+
+
 def start_polling() -> None:
     """
     Простой бесконечный long-polling.
@@ -68,13 +135,8 @@ def start_polling() -> None:
             ).get("chat", {}).get("id")
             logger.info("[poller] update %s from chat %s", upd_id, chat_id)
 
-            # импорт тут, чтобы не ловить циклический импорт наверху
-            from telegram_bot import handle_update  # noqa
-
-            try:
-                handle_update(upd)
-            except Exception as e:
-                logger.exception("[poller] handle_update error: %s", e)
+            # не ждём обработку — следующий getUpdates уходит сразу
+            dispatcher.submit(upd)
 
         # чуть-чуть подождём
         time.sleep(0.3)
@@ -0,0 +1,55 @@
+# tests/test_dedupe.py
+from dedupe import PlaceDedupeIndex, address_key, name_key, name_tokens, website_domain
+
+
+def test_name_key_drops_legal_tails_and_punctuation():
+    assert name_tokens("Bright Smile Dental, PC") == ("bright", "smile", "dental")
+    assert name_key("Bright Smile Dental, PC") == name_key("bright smile dental")
+    assert name_key("Smith & Jones") == "smith jones"
+
+
+def test_name_key_of_noise_only_name_is_not_empty():
+    assert name_key("The Co") == "the co"
+
+
+def test_address_key_survives_formatting():
+    a = address_key("123 Main Street, Suite 200, Austin, TX 78701")
+    b = address_key("123 Main St Ste 5, Austin TX 78701, USA")
+    assert a == b == "123 78701"
+    assert address_key("Main Street, Austin, TX") == ""
+
+
+def test_website_domain_ignores_shared_hosts():
+    assert website_domain("https://www.brightsmile.com/contact") == "brightsmile.com"
+    assert website_domain("brightsmile.com:443") == "brightsmile.com"
+    assert website_domain("https://www.facebook.com/brightsmile") == ""
+    assert website_domain("https://brightsmile.wixsite.com/home") == ""
+
+
+def _place(pid, name, address="", website=""):
+    return {"place_id": pid, "name": name, "address": address, "website": website}
+
+
+def test_index_merges_same_clinic_variants():
+    idx = PlaceDedupeIndex()
+    first = _place("1", "Bright Smile Dental, PC", "123 Main St, Austin, TX 78701", "https://brightsmile.com")
+    assert idx.add(first)
+    assert not idx.add(dict(first))
+    assert not idx.add(_place("2", "Bright Smile Dental", "123 Main Street Suite 4, Austin TX 78701"))
+    assert not idx.add(_place("3", "Bright Smile Dental Care", "", "http://www.brightsmile.com/"))
+    assert idx.add(_place("4", "Bright Smile", "77 Lake Rd, Austin, TX 78702", "https://brightsmile.com"))
+    assert len(idx) == 2
+
+
+def test_index_keeps_chain_branches_apart():
+    idx = PlaceDedupeIndex()
+    assert idx.add(_place("1", "Aspen Dental", "100 Oak Ave, Dallas, TX 75201", "https://aspendental.com"))
+    assert idx.add(_place("2", "Aspen Dental", "900 Elm St, Dallas, TX 75202", "https://aspendental.com"))
+    assert len(idx) == 2
+
+
+def test_index_keeps_different_clinics_at_one_address():
+    idx = PlaceDedupeIndex()
+    assert idx.add(_place("1", "Bright Smile Dental", "500 Medical Pkwy, Austin, TX 78705"))
+    assert idx.add(_place("2", "Austin Orthodontics", "500 Medical Parkway, Austin, TX 78705"))
+    assert idx.match(_place("3", "Austin Orthodontics", "500 Medical Pkwy Ste 2, Austin TX 78705"))["place_id"] == "2"
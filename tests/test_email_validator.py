@@ -0,0 +1,134 @@
+# tests/test_email_validator.py
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("pydantic_settings")
+
+import email_validator as ev  # noqa: E402
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    """
+    MX без DNS: домены из dead — без почтового хоста, остальные — с ним.
+    """
+    calls = []
+    dead = {"dead-clinic.com"}
+
+    def _lookup(domain):
+        calls.append(domain)
+        return domain not in dead
+
+    monkeypatch.setattr(ev, "mx_resolver", ev.MXResolver(lookup=_lookup))
+    monkeypatch.setattr(ev.settings, "EMAIL_MX_CHECK", 1)
+    return calls
+
+
+@pytest.mark.parametrize("addr", ["", "no-at-sign", "a@b", "a..b@clinic.com", "a@@clinic.com", "x" * 65 + "@clinic.com"])
+def test_bad_syntax_is_rejected(addr, resolver):
+    assert ev.local_verdict(addr) is False
+
+
+@pytest.mark.parametrize("addr", ["x@mailinator.com", "x@eu.mailinator.com", "x@yopmail.com"])
+def test_disposable_domains_are_rejected(addr, resolver):
+    assert ev.local_verdict(addr) is False
+
+
+@pytest.mark.parametrize("addr", ["noreply@clinic.com", "mailer-daemon@clinic.com", "you@example.com", "x@sentry.io", "logo@2x.png"])
+def test_blacklisted_addresses_are_rejected(addr, resolver):
+    assert ev.local_verdict(addr) is False
+
+
+def test_role_addresses_are_left_to_the_provider(resolver):
+    assert ev.local_verdict("info@bright-smile.com") is None
+    assert ev.local_verdict("Office@Bright-Smile.com") is None
+
+
+def test_domain_without_mail_host_is_rejected(resolver):
+    assert ev.local_verdict("dr@dead-clinic.com") is False
+    assert ev.local_verdict("dr@dead-clinic.com", check_mx=False) is None
+
+
+def test_invalid_blacklist_pattern_is_skipped():
+    compiled = ev._compile_patterns([r"@competitor\.com$", r"([unclosed"], "test")
+    assert [p.pattern for p in compiled] == [r"@competitor\.com$"]
+
+
+def test_mx_resolver_does_not_cache_unknown():
+    answers = iter([None, True])
+    calls = []
+
+    def _lookup(domain):
+        calls.append(domain)
+        return next(answers)
+
+    r = ev.MXResolver(lookup=_lookup)
+    assert r.has_mail_host("clinic.com") is None
+    assert r.has_mail_host("clinic.com") is True
+    assert r.has_mail_host("clinic.com") is True
+    assert calls == ["clinic.com", "clinic.com"]
+
+
+def test_batch_resolves_each_domain_once(resolver, monkeypatch):
+    monkeypatch.setattr(ev.settings, "EMAIL_LOCAL_VALIDATION", 1)
+    monkeypatch.setattr(ev.settings, "EMAIL_VALIDATION_PROVIDER", "")
+    result = ev.validate_emails_batch(
+        ["a@bright-smile.com", "B@bright-smile.com", "c@dead-clinic.com", "noreply@bright-smile.com", "d@dead-clinic.com"]
+    )
+    assert result == {
+        "a@bright-smile.com": True,
+        "b@bright-smile.com": True,
+        "c@dead-clinic.com": False,
+        "noreply@bright-smile.com": False,
+        "d@dead-clinic.com": False,
+    }
+    assert sorted(resolver) == ["bright-smile.com", "dead-clinic.com"]
+
+
+@pytest.mark.parametrize(
+    "status, verdict",
+    [
+        ("Deliverable", True),
+        ("Success", True),
+        ("valid", True),
+        ("Undeliverable", False),
+        ("MailboxDoesNotExist invalid", False),
+        ("rejected", False),
+        ("Unknown", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_provider_status_mapping(status, verdict):
+    # "undeliverable" содержит "deliverable", "invalid" — "valid": плохие слова проверяются первыми
+    assert ev._verdict(status) is verdict
+
+
+def test_entry_status_reads_string_or_object():
+    assert ev._entry_status({"classification": "Deliverable"}) == "Deliverable"
+    assert ev._entry_status({"classification": {"result": "Undeliverable"}}) == "Undeliverable"
+    assert ev._entry_status({"status": "Success"}) == "Success"
+
+
+def test_validation_cache_roundtrip(tmp_path):
+    cache = ev.ValidationCache(str(tmp_path / "verdicts.sqlite3"))
+    cache.put_many({"A@Clinic.com": True, "b@clinic.com": False, "": True})
+    assert cache.get_many(["a@clinic.com", "B@CLINIC.COM", "c@clinic.com"]) == {
+        "a@clinic.com": True,
+        "b@clinic.com": False,
+    }
+
+
+def test_validation_cache_ttls_differ_by_verdict(tmp_path, monkeypatch):
+    monkeypatch.setattr(ev.settings, "EMAIL_VALIDATION_TTL_VALID_DAYS", 0)
+    monkeypatch.setattr(ev.settings, "EMAIL_VALIDATION_TTL_INVALID_DAYS", 180)
+    path = str(tmp_path / "verdicts.sqlite3")
+    cache = ev.ValidationCache(path)
+    cache.put_many({"ok@clinic.com": True, "bad@clinic.com": False})
+    # валидный вердикт с нулевым TTL уже протух, невалидный ещё живёт
+    assert cache.get_many(["ok@clinic.com", "bad@clinic.com"]) == {"bad@clinic.com": False}
+
+    # протухшее вычищается при следующем открытии
+    reopened = ev.ValidationCache(path)
+    assert reopened.purge_expired() == 0
+    assert reopened.get_many(["bad@clinic.com"]) == {"bad@clinic.com": False}
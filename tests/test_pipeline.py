@@ -0,0 +1,54 @@
+# tests/test_pipeline.py
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def test_items_flow_through_all_stages():
+    out = []
+    lock = threading.Lock()
+
+    def _collect(item, _ctx):
+        with lock:
+            out.append(item)
+
+    Pipeline([
+        Stage("double", lambda x, _ctx: [x * 2], workers=3),
+        Stage("skip_odd_source", lambda x, _ctx: [x] if x % 4 == 0 else None, workers=2),
+        Stage("collect", _collect),
+    ]).run(range(10))
+    assert sorted(out) == [0, 4, 8, 12, 16]
+
+
+def test_errors_go_to_on_error_and_do_not_stop_the_stage():
+    failed = []
+
+    def _fn(x, _ctx):
+        if x == 3:
+            raise ValueError("boom")
+        return None
+
+    Pipeline([Stage("s", _fn, workers=2, on_error=lambda item, e: failed.append((item, str(e))))]).run(range(6))
+    assert failed == [(3, "boom")]
+
+
+def test_broken_context_hands_items_to_on_error():
+    failed = []
+
+    @contextmanager
+    def _ctx():
+        raise RuntimeError("no session")
+        yield  # pragma: no cover
+
+    Pipeline([Stage("s", lambda x, c: None, context=_ctx, on_error=lambda item, e: failed.append(item))]).run(
+        range(4)
+    )
+    assert sorted(failed) == [0, 1, 2, 3]
+
+
+def test_pipeline_needs_stages():
+    with pytest.raises(ValueError):
+        Pipeline([])
@@ -0,0 +1,19 @@
+# tests/test_place_registry.py
+from place_registry import PlaceRegistry
+
+
+def test_place_registry_put_and_get_many(tmp_path):
+    reg = PlaceRegistry(str(tmp_path / "registry.sqlite3"))
+    reg.put("p1", "tx", "L1", "T1")
+    reg.put("", "tx")
+    got = reg.get_many(["p1", "p2", ""])
+    assert list(got) == ["p1"]
+    assert got["p1"]["state"] == "TX"
+    assert got["p1"]["task_id"] == "T1"
+    assert reg.get("p2") is None
+
+
+def test_place_registry_survives_reopen(tmp_path):
+    path = str(tmp_path / "registry.sqlite3")
+    PlaceRegistry(path).put("p1", "ca", "L2")
+    assert PlaceRegistry(path).get("p1")["list_id"] == "L2"
@@ -0,0 +1,26 @@
+# tests/test_places_cache.py
+from places_cache import PlacesCache
+
+
+def test_places_cache_roundtrip_and_ttl(tmp_path):
+    cache = PlacesCache(str(tmp_path / "places.sqlite3"), ttl=60)
+    key = PlacesCache.key(query="dentist in Austin", max_pages=3)
+    assert key == PlacesCache.key(max_pages=3, query="dentist in Austin")
+    assert key != PlacesCache.key(query="dentist in Austin", max_pages=1)
+    assert cache.get(key) is None
+
+    cache.put(key, {"places": [{"id": "a"}]})
+    assert cache.get(key) == {"places": [{"id": "a"}]}
+
+    cache.ttl = 0
+    assert cache.get(key) is None
+    assert cache.purge_expired() == 1
+
+
+def test_expired_rows_are_purged_on_open(tmp_path):
+    path = str(tmp_path / "places.sqlite3")
+    old = PlacesCache(path, ttl=60)
+    old.put("k", {"places": []})
+
+    PlacesCache(path, ttl=0)
+    assert PlacesCache(path, ttl=60).get("k") is None
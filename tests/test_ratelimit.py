@@ -0,0 +1,72 @@
+# tests/test_ratelimit.py
+import time
+
+from ratelimit import RateGovernor, RateLimiter
+
+
+def test_limiter_allows_burst_then_spaces_calls():
+    lim = RateLimiter(10, burst=2)
+    assert lim.reserve() == 0.0
+    assert lim.reserve() == 0.0
+    assert 0.05 < lim.reserve() <= 0.1
+
+
+def test_limiter_without_rate_never_waits():
+    lim = RateLimiter(0)
+    assert all(lim.reserve() == 0.0 for _ in range(100))
+    lim.pause(10)
+    assert lim.reserve() == 0.0
+
+
+def test_pause_holds_next_call():
+    lim = RateLimiter(1, burst=5)
+    lim.pause(3)
+    assert 2.9 < lim.reserve() <= 4.0
+
+
+def _governor(remaining, reset_in, low_water=10):
+    gov = RateGovernor(reserve=2, low_water=low_water)
+    gov.update({"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(time.time() + reset_in)})
+    return gov
+
+
+def test_governor_passes_through_with_plenty_of_budget():
+    gov = _governor(99, 60)
+    assert all(gov.delay() == 0.0 for _ in range(50))
+
+
+def test_governor_spreads_the_last_requests_until_reset():
+    gov = _governor(7, 60)
+    waits = [gov.delay() for _ in range(3)]
+    assert waits[0] == 0.0
+    assert 11 < waits[1] < waits[2] < 60
+
+
+def test_governor_waits_for_reset_when_budget_is_gone():
+    gov = _governor(2, 30)
+    assert 29 < gov.delay() <= 30
+
+
+def test_governor_unknown_budget_does_not_wait():
+    assert RateGovernor().delay() == 0.0
+
+
+def test_throttled_honours_retry_after():
+    gov = RateGovernor(backoff_base=0.1, backoff_max=0.1)
+    wait = gov.throttled({"Retry-After": "7"}, attempt=0)
+    assert 6.9 < wait <= 7.0
+    assert 6.9 < gov.delay() <= 7.0
+
+
+def test_governor_exhausted_budget_blocks_every_caller():
+    gov = _governor(2, 30)
+    waits = [gov.delay() for _ in range(5)]
+    assert all(29 < w <= 30 for w in waits)
+
+
+def test_governor_low_budget_spreads_then_blocks_until_reset():
+    gov = _governor(5, 60)
+    waits = [gov.delay() for _ in range(8)]
+    assert waits[0] == 0.0
+    assert waits[0] < waits[1] < waits[2] < 60
+    assert all(59 < w <= 60 for w in waits[3:])
@@ -0,0 +1,11 @@
+# tests/test_utils.py
+from utils import _norm_name
+
+
+def test_name_index_key_is_exact_up_to_case_and_spaces():
+    assert _norm_name("  Bright  Smile Dental ") == _norm_name("bright smile dental")
+
+
+def test_name_index_key_keeps_legal_tails_apart():
+    assert len({_norm_name("Smith DDS"), _norm_name("Smith DMD"), _norm_name("smith")}) == 3
+    assert _norm_name("Dental Co") != _norm_name("The Dental Co")
@@ -1,5 +1,6 @@
 # utils.py
-from typing import Dict, Any
+import re
+from typing import Dict, Any, Optional
 
 def _task_status_str(task: Dict[str, Any]) -> str:
     """
@@ -11,3 +12,35 @@ def _task_status_str(task: Dict[str, Any]) -> str:
     if isinstance(st, dict):
         return st.get("status") or st.get("value") or ""
     return ""
+
+
+_EMAIL_IN_DESCRIPTION = re.compile(
+    r"^\s*Email:?\s*[\r\n\s]*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _extract_email(description: str) -> Optional[str]:
+    """
+    Достаёт адрес из строки 'Email: ...' в description задачи.
+    """
+    if not description:
+        return None
+    m = _EMAIL_IN_DESCRIPTION.search(description)
+    return m.group(1).strip() if m else None
+
+
+def _task_description(task: Dict[str, Any]) -> str:
+    """
+    Описание задачи: markdown-версия (include_markdown_description), иначе обычная.
+    """
+    return task.get("markdown_description") or task.get("description") or ""
+
+
+def _norm_name(name: str) -> str:
+    """
+    Ключ для дедупа по названию клиники (как раньше: strip + lower, пробелы схлопнуты).
+    Юр. хвосты НЕ режем: по одному названию "Smith DDS" и "Smith DMD" — разные клиники;
+    нечёткий дедуп мест — в dedupe.PlaceDedupeIndex, там есть ещё адрес и сайт.
+    """
+    return " ".join((name or "").lower().split())